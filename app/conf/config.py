@@ -51,6 +51,63 @@ class Settings(BaseSettings):
             raise ValueError("When IS_MULTI_TENANT_DB is false DATABASE_NAME required")
 
     TEST_DATABASE_NAME: Optional[str] = "test"
+    # Tenant engines kept alive per worker, least recently used ones are disposed first
+    DATABASE_TENANT_MAX_ENGINES: Optional[int] = 1024
+    # Seconds without requests after which a tenant pool is closed, 0 disables reaping
+    DATABASE_TENANT_IDLE_TIMEOUT: Optional[int] = 60 * 10
+    # Seconds between reaper runs, at least 1
+    DATABASE_TENANT_REAP_INTERVAL: Optional[int] = 60
+
+    @field_validator("DATABASE_TENANT_REAP_INTERVAL")
+    def validate_database_tenant_reap_interval(cls, v: Optional[int]):
+        if v is None or v < 1:
+            raise ValueError("DATABASE_TENANT_REAP_INTERVAL must be at least 1 second")
+        return v
+
+    # Pool options of every tenant engine, see sqlalchemy.create_engine
+    DATABASE_POOL_SIZE: Optional[int] = 5
+    DATABASE_MAX_OVERFLOW: Optional[int] = 10
+    DATABASE_POOL_RECYCLE: Optional[int] = 60 * 60
+    DATABASE_POOL_TIMEOUT: Optional[float] = 30
+    DATABASE_POOL_USE_LIFO: Optional[bool] = False
+    DATABASE_POOL_PRE_PING: Optional[bool] = True
+    # When positive, only connections idle longer than this many seconds are pinged on checkout
+    DATABASE_POOL_PRE_PING_IDLE: Optional[float] = 0
+    # Per tenant overrides, e.g. {"tenant": {"pool_size": 20, "pool_pre_ping_idle": 30}}
+    DATABASE_POOL_OVERRIDES: Optional[Dict[str, Dict[str, Any]]] = {}
+    # Pool wait, query time and row count histograms served on /metrics
+    DATABASE_INSTRUMENTATION: Optional[bool] = True
+    # Bearer token required by /metrics, the endpoint is disabled (404) while unset
+    METRICS_TOKEN: Optional[str] = None
+    # "database" - pool per tenant database, "schema" - one shared pool, tables qualified by tenant schema
+    DATABASE_TENANT_ROUTING: Optional[str] = "database"
+
+    @field_validator("DATABASE_TENANT_ROUTING")
+    def validate_database_tenant_routing(cls, v: Optional[str]):
+        if v not in ("database", "schema"):
+            raise ValueError("DATABASE_TENANT_ROUTING must be either database or schema")
+        return v
+
+    # Users of authenticated requests kept per worker (id and email), 0 disables
+    USER_CACHE_SIZE: Optional[int] = 4096
+    # Seconds a cached user is trusted without reading the database
+    USER_CACHE_TTL: Optional[int] = 60
+    # Emails without a user remembered per worker, repeated logins skip the database lookup
+    # and answer one round trip faster than known emails, which reveals that the email has
+    # no user. 0 disables it
+    LOGIN_MISS_CACHE_SIZE: Optional[int] = 0
+    LOGIN_MISS_CACHE_TTL: Optional[int] = 30
+    # Password hashes computed at once per worker, "thread" or "process" pool
+    PASSWORD_HASHER_WORKERS: Optional[int] = 4
+    PASSWORD_HASHER_EXECUTOR: Optional[str] = "thread"
+    # Hashes allowed to wait for a free worker, further logins are rejected with 503
+    PASSWORD_HASHER_MAX_PENDING: Optional[int] = 64
+
+    @field_validator("PASSWORD_HASHER_EXECUTOR")
+    def validate_password_hasher_executor(cls, v: Optional[str]):
+        if v not in ("thread", "process"):
+            raise ValueError("PASSWORD_HASHER_EXECUTOR must be either thread or process")
+        return v
 
     TIME_ZONE: Optional[str] = "Asia/Ashgabat"
     USE_TZ: Optional[bool] = True
@@ -78,15 +135,31 @@ class JWTSettings(BaseSettings):
     JWT_AUTH_COOKIE_NAME: Optional[str] = 'Authorization'
     JWT_GIT_HEADER_NAME: Optional[str] = 'X-IDToken'  # Google id token header name
     JWT_GIT_COOKIE_NAME: Optional[str] = 'X-IDToken'  # Google id token cookie name
+    JWT_GIT_CERTS_URL: Optional[str] = 'https://www.googleapis.com/oauth2/v1/certs'  # Google id token certs
+    JWT_GIT_CERTS_REFRESH_BEFORE: Optional[int] = 60  # Seconds before certs expiry to refresh them in background
+    JWT_GIT_CERTS_MIN_REFETCH: Optional[int] = 30  # Minimal seconds between refetches caused by unknown key ids
+    JWT_GIT_TOKEN_CACHE_SIZE: Optional[int] = 1024  # Verified Google id tokens kept per worker, 0 disables
+    JWT_TOKEN_CACHE_SIZE: Optional[int] = 1024  # Decoded access tokens kept per worker, 0 disables
+    JWT_VERIFY_BATCH_MAX_SIZE: Optional[int] = 100  # Tokens accepted by one /auth/verify-tokens/ call
+    JWT_VERIFY_BATCH_WORKERS: Optional[int] = 4  # Threads verifying RSA/EC batches, 0 verifies them one by one
     JWT_AUTH_HEADER_PREFIX: str = 'Bearer'
     JWT_AUDIENCE: Optional[str] = 'client'
+    # Password hashing policy, the first scheme hashes new passwords, hashes of other schemes or
+    # of other costs are upgraded on the next successful login. "argon2" requires argon2-cffi
+    JWT_PASSWORD_SCHEMES: Optional[List[str]] = ['bcrypt']
+    JWT_PASSWORD_BCRYPT_ROUNDS: Optional[int] = 12
+    JWT_PASSWORD_ARGON2_TIME_COST: Optional[int] = 3
+    JWT_PASSWORD_ARGON2_MEMORY_COST: Optional[int] = 64 * 1024  # KiB
+    JWT_PASSWORD_REHASH: Optional[bool] = True  # Write upgraded hashes back on login
 
     # Helper functions
     JWT_PASSWORD_VERIFY: Optional[str] = 'app.utils.security.verify_password'
     JWT_PASSWORD_HANDLER: Optional[str] = 'app.utils.security.get_password_hash'
+    JWT_PASSWORD_VERIFY_AND_UPDATE: Optional[str] = 'app.utils.security.verify_and_update_password'
     JWT_PAYLOAD_HANDLER: Optional[str] = 'app.utils.security.jwt_payload'
     JWT_ENCODE_HANDLER: Optional[str] = 'app.utils.security.jwt_encode'
     JWT_DECODE_HANDLER: Optional[str] = 'app.utils.security.jwt_decode'
+    JWT_DECODE_MANY_HANDLER: Optional[str] = 'app.utils.security.jwt_decode_many'
     JWT_ISSUER: Optional[str] = 'backend'
 
     model_config = SettingsConfigDict(
@@ -1,4 +1,5 @@
 from datetime import timedelta
+from typing import List
 from uuid import uuid4
 
 from fastapi import APIRouter, Depends, HTTPException
@@ -7,6 +8,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from pydantic_core import ErrorDetails, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
+from starlette.concurrency import run_in_threadpool
 from fastapi.security.utils import get_authorization_scheme_param
 
 from app.contrib.account.repository import user_repo
@@ -14,9 +16,9 @@ from app.core.schema import IResponseBase
 from app.utils.jose import JWTError
 from app.utils.security import lazy_jwt_settings
 from app.routers.dependency import get_async_db, get_current_user, get_audience
-from app.contrib.account.schema import Token, TokenBody, TokenPayload, RefreshTokenBody, UserVisible
+from app.contrib.account.schema import Token, TokenBody, TokensBody, TokenPayload, RefreshTokenBody, UserVisible
 
-from .models import User
+from .cache import UserIdentity
 
 api = APIRouter()
 
@@ -36,6 +38,13 @@ def create_token(user_id: int, allow_refresh: bool, aud: str) -> dict:
     return result
 
 
+def token_param(value: str) -> str:
+    if value.startswith("Bearer"):
+        bearer, token = get_authorization_scheme_param(value)
+        return token
+    return value
+
+
 @api.post('/auth/get-token/', tags=["auth"], name='get-token', response_model=Token)
 async def get_token(
         data: OAuth2PasswordRequestForm = Depends(),
@@ -69,10 +78,7 @@ async def get_token(
 async def verify_token(
         token_in: TokenBody
 ) -> dict:
-    if token_in.token.startswith("Bearer"):
-        bearer, token = get_authorization_scheme_param(token_in.token)
-    else:
-        token = token_in.token
+    token = token_param(token_in.token)
     try:
         lazy_jwt_settings.JWT_DECODE_HANDLER(token)
     except (JWTError, ValidationError) as e:
@@ -80,6 +86,26 @@ async def verify_token(
     return {"message": "Token verified", "data": True}
 
 
+@api.post(
+    "/auth/verify-tokens/", tags=["auth"], name="verify-access-tokens",
+    response_model=IResponseBase[List[IResponseBase[bool]]],
+    description="Verify a batch of access tokens, results are in the order of the tokens"
+)
+async def verify_tokens(
+        tokens_in: TokensBody
+) -> dict:
+    tokens = [token_param(token) for token in tokens_in.tokens]
+    results = await run_in_threadpool(lazy_jwt_settings.JWT_DECODE_MANY_HANDLER, tokens)
+    return {
+        "message": "Tokens verified",
+        "data": [
+            {"message": str(result), "data": False} if isinstance(result, Exception)
+            else {"message": "Token verified", "data": True}
+            for result in results
+        ],
+    }
+
+
 @api.post(
     "/auth/refresh-token/", tags=["auth"], name="refresh-token", response_model=Token,
     description="Refresh access token"
@@ -106,5 +132,5 @@ async def new_refresh_token(
 
 
 @api.get("/auth/me/", response_model=UserVisible, name='me')
-async def get_me(user: User = Depends(get_current_user)) -> dict:
+async def get_me(user: UserIdentity = Depends(get_current_user)) -> dict:
     return {"id": user.id, "email": user.email}
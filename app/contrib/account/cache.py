@@ -0,0 +1,98 @@
+import time
+from typing import NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+from app.conf.config import settings
+from app.core.cache import ExpiringLRUCache, register_cache_metrics
+
+if TYPE_CHECKING:
+    from .models import User
+
+__all__ = ('UserIdentity', 'UserIdentityCache', 'user_cache', 'LoginMissCache', 'login_miss_cache')
+
+
+class UserIdentity(NamedTuple):
+    id: int
+    email: str
+
+
+class UserIdentityCache(ExpiringLRUCache):
+    """
+    Identity of authenticated users keyed by (audience, user id). Entries are
+    trusted for `ttl` seconds and dropped by the user repository whenever a user
+    is created, updated or deleted.
+    """
+
+    def __init__(self, max_size: Optional[int] = 4096, ttl: Optional[float] = 60):
+        super().__init__(max_size)
+        self.ttl = ttl
+
+    def get_user(self, audience: str, user_id: int) -> Optional[UserIdentity]:
+        return self.get((audience, user_id))
+
+    def set_user(self, audience: str, user: "User") -> UserIdentity:
+        identity = UserIdentity(id=user.id, email=user.email)
+        if self.ttl:
+            self.set((audience, user.id), identity, time.time() + self.ttl)
+        return identity
+
+    def invalidate(self, audience: Optional[str], user_id: int) -> None:
+        """
+        Forget the user of the audience, of every audience when it is unknown
+        :param audience:
+        :param user_id:
+        :return:
+        """
+        if audience is not None:
+            self.pop((audience, user_id))
+            return
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == user_id]:
+                del self._entries[key]
+
+
+user_cache = UserIdentityCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+register_cache_metrics('user_identity_cache', user_cache)
+
+
+class LoginMissCache(ExpiringLRUCache):
+    """
+    Emails of recent logins without a user keyed by (audience, email). Repeated
+    attempts, e.g. credential stuffing, skip the database lookup for `ttl`
+    seconds, so they answer one round trip faster than a known email and the
+    timing tells the email has no user. Disabled unless `max_size` is set.
+    Creating a user or changing its email drops the entry.
+    """
+
+    def __init__(self, max_size: Optional[int] = 0, ttl: Optional[float] = 30):
+        super().__init__(max_size)
+        self.ttl = ttl
+
+    @staticmethod
+    def key(audience: Optional[str], email: str) -> Tuple[Optional[str], str]:
+        return audience, email.lower()
+
+    def is_missing(self, audience: Optional[str], email: str) -> bool:
+        return self.get(self.key(audience, email)) is not None
+
+    def add(self, audience: Optional[str], email: str) -> None:
+        if self.ttl:
+            self.set(self.key(audience, email), True, time.time() + self.ttl)
+
+    def discard(self, audience: Optional[str], email: str) -> None:
+        """
+        Forget the email of the audience, of every audience when it is unknown
+        :param audience:
+        :param email:
+        :return:
+        """
+        if audience is not None:
+            self.pop(self.key(audience, email))
+            return
+        email = email.lower()
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == email]:
+                del self._entries[key]
+
+
+login_miss_cache = LoginMissCache(settings.LOGIN_MISS_CACHE_SIZE, settings.LOGIN_MISS_CACHE_TTL)
+register_cache_metrics('login_miss_cache', login_miss_cache)
@@ -1,16 +1,28 @@
-from typing import Union, Optional, TYPE_CHECKING
+import asyncio
+import logging
+from typing import Union, Optional, TYPE_CHECKING, Iterable, List, Any, Set
 
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.utils.security import lazy_jwt_settings
-from app.db.repository import CRUDBaseSync, CRUDBase
+from app.utils.hashing import password_hasher
+from app.utils.security import lazy_jwt_settings, verify_dummy_password
+from app.db.instrumentation import instrumented
+from app.db.repository import CRUDBaseSync, CRUDBase, refresh_obj, refresh_obj_async
+from app.db.session import session_tenant
 
+from .cache import login_miss_cache, user_cache
 from .schema import UserBase, UserCreate
 from .models import User
 
 if TYPE_CHECKING:
     from sqlalchemy.orm import Session
-    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Pending password hash upgrades, referenced until done
+rehash_tasks: Set[asyncio.Task] = set()
 
 
 def convert_user_data(obj_in: dict) -> dict:
@@ -22,32 +34,137 @@ def convert_user_data(obj_in: dict) -> dict:
     return obj_in
 
 
+async def convert_user_data_async(obj_in: dict) -> dict:
+    if obj_in.get('password'):
+        hashed_password = await password_hasher.hash(obj_in["password"])
+        del obj_in["password"]
+        obj_in["hashed_password"] = hashed_password
+
+    return obj_in
+
+
+def convert_users_data(objs_in: List[dict]) -> List[dict]:
+    return [convert_user_data(obj_in) for obj_in in objs_in]
+
+
+async def convert_users_data_async(objs_in: List[dict]) -> List[dict]:
+    if not any(obj_in.get('password') for obj_in in objs_in):
+        # Nothing to hash, no slot of the hashing pool is taken
+        return convert_users_data(objs_in)
+    # Hash the whole batch with one slot of the hashing pool
+    return await password_hasher.run('hash', convert_users_data, objs_in)
+
+
+def user_data(obj_in: Union[dict, UserBase]) -> dict:
+    if isinstance(obj_in, dict):
+        return dict(obj_in)
+    return obj_in.model_dump(exclude_unset=True)
+
+
+def invalidate_users(db: Union["Session", "AsyncSession"], user_ids: Iterable[Any]) -> None:
+    """
+    Drop written users of the session tenant from the identity cache
+    :param db:
+    :param user_ids:
+    :return:
+    """
+    tenant = session_tenant(db)
+    for user_id in user_ids:
+        if user_id is not None:
+            user_cache.invalidate(tenant, user_id)
+
+
+def invalidate_login_misses(db: Union["Session", "AsyncSession"], objs_in: Iterable[dict]) -> None:
+    """
+    Let new or changed emails of the session tenant log in right away
+    :param db:
+    :param objs_in: written user data
+    :return:
+    """
+    tenant = session_tenant(db)
+    for obj_in in objs_in:
+        if obj_in.get('email'):
+            login_miss_cache.discard(tenant, obj_in['email'])
+
+
 class CRUDUserSync(CRUDBaseSync[User]):
     def authenticate(self, db: "Session", email: str, password: str) -> Optional[User]:
-        user_db: Optional[User] = self.first(db, params={'email': email})
+        tenant = session_tenant(db)
+        user_db: Optional[User] = None
+        if not login_miss_cache.is_missing(tenant, email):
+            user_db = self.first(db, params={'email': email})
         if not user_db:
+            login_miss_cache.add(tenant, email)
+            # Unknown emails pay for a password verify like wrong passwords do. Misses served by
+            # the miss cache skip the user lookup, they are one database round trip faster
+            verify_dummy_password(password)
             return None
-        check_pass = lazy_jwt_settings.JWT_PASSWORD_VERIFY(password, user_db.hashed_password)
+        check_pass, new_hash = lazy_jwt_settings.JWT_PASSWORD_VERIFY_AND_UPDATE(password, user_db.hashed_password)
         if not check_pass:
             return None
+        if new_hash and lazy_jwt_settings.JWT_PASSWORD_REHASH:
+            self.update(db, db_obj=user_db, obj_in={'hashed_password': new_hash})
         return user_db
 
-    def create(self, db: "Session", obj_in: Union[dict, UserCreate], **kwargs) -> User:
+    @instrumented
+    def create(
+            self, db: "Session", obj_in: Union[dict, UserCreate], refresh: Optional[bool] = None, **kwargs
+    ) -> User:
         data_in = convert_user_data(obj_in)
         new_db_obj = User(**data_in)
         db.add(new_db_obj)
         db.commit()
-        db.refresh(new_db_obj)
+        # Reloads the expired object before its id is read
+        refresh_obj(db, new_db_obj, refresh)
+        invalidate_users(db, (new_db_obj.id,))
+        invalidate_login_misses(db, (data_in,))
         return new_db_obj
 
+    @instrumented
     def update(
             self,
             db: "Session",
             db_obj: User,
-            obj_in: Union[UserBase, dict]
+            obj_in: Union[UserBase, dict],
+            refresh: Optional[bool] = None,
     ) -> User:
-        data_in = convert_user_data(obj_in)
-        return super().update(db, db_obj=db_obj, obj_in=data_in)
+        data_in = convert_user_data(user_data(obj_in))
+        db_obj = super().update(db, db_obj=db_obj, obj_in=data_in, refresh=refresh)
+        invalidate_users(db, (db_obj.id,))
+        invalidate_login_misses(db, (data_in,))
+        return db_obj
+
+    @instrumented
+    def delete(self, db: "Session", db_obj: User) -> User:
+        user_id = db_obj.id
+        db_obj = super().delete(db, db_obj=db_obj)
+        invalidate_users(db, (user_id,))
+        return db_obj
+
+    def remove(self, db: "Session", expressions: list):
+        result = super().remove(db, expressions)
+        # Removed users are unknown, forget all of them
+        user_cache.clear()
+        return result
+
+    def bulk_create(self, db: "Session", objs_in: Iterable[Union[dict, UserCreate]], **kwargs) -> Union[int, List[Any]]:
+        objs_in = [convert_user_data(user_data(obj_in)) for obj_in in objs_in]
+        result = super().bulk_create(db, objs_in, **kwargs)
+        invalidate_login_misses(db, objs_in)
+        return result
+
+    def bulk_update(self, db: "Session", objs_in: Iterable[dict], **kwargs) -> int:
+        objs_in = [convert_user_data(user_data(obj_in)) for obj_in in objs_in]
+        count = super().bulk_update(db, objs_in, **kwargs)
+        invalidate_users(db, (obj_in.get('id') for obj_in in objs_in))
+        invalidate_login_misses(db, objs_in)
+        return count
+
+    def bulk_delete(self, db: "Session", ids: Iterable[Any], **kwargs) -> int:
+        ids = list(ids)
+        count = super().bulk_delete(db, ids, **kwargs)
+        invalidate_users(db, ids)
+        return count
 
     @staticmethod
     def verify_password(user: User, password: str) -> bool:
@@ -58,21 +175,58 @@ class CRUDUserSync(CRUDBaseSync[User]):
 
 class CRUDUser(CRUDBase[User]):
     @staticmethod
+    @instrumented
     async def get_by_email(async_db: "AsyncSession", *, email: str) -> Optional[User]:
         result = await async_db.execute(select(User).filter(User.email == email))
         return result.scalars().first()
 
     async def authenticate(self, async_db: "AsyncSession", *, email: str, password: str) -> Optional["User"]:
-        user_db = await self.first(async_db, params={'email': email, })
+        tenant = session_tenant(async_db)
+        user_db = None
+        if not login_miss_cache.is_missing(tenant, email):
+            user_db = await self.first(async_db, params={'email': email, })
         if not user_db:
+            login_miss_cache.add(tenant, email)
+            # Unknown emails pay for a password verify like wrong passwords do. Misses served by
+            # the miss cache skip the user lookup, they are one database round trip faster
+            await password_hasher.verify_dummy(password)
             return None
-        check_pass = lazy_jwt_settings.JWT_PASSWORD_VERIFY(password, user_db.hashed_password)
+        check_pass, new_hash = await password_hasher.verify_and_update(password, user_db.hashed_password)
         if not check_pass:
             return None
+        if new_hash and lazy_jwt_settings.JWT_PASSWORD_REHASH:
+            # Login does not wait for the upgraded hash to be written
+            task = asyncio.get_running_loop().create_task(
+                self.update_password_hash(async_db.bind, user_db.id, new_hash)
+            )
+            rehash_tasks.add(task)
+            task.add_done_callback(rehash_tasks.discard)
         return user_db
 
-    async def create(self, async_db: "AsyncSession", obj_in: Union[dict, UserCreate], **kwargs) -> User:
-        data_in = convert_user_data(obj_in)
+    @instrumented
+    async def update_password_hash(self, bind: "AsyncEngine", user_id: int, hashed_password: str) -> None:
+        """
+        Store an upgraded password hash with a session of its own
+        :param bind: engine of the tenant
+        :param user_id:
+        :param hashed_password:
+        :return:
+        """
+        try:
+            async with AsyncSession(bind=bind, expire_on_commit=False) as async_db:
+                await super().bulk_update(async_db, objs_in=[{'id': user_id, 'hashed_password': hashed_password}])
+        except Exception as e:
+            logger.warning("Password hash upgrade of user %s failed: %s", user_id, e)
+
+    @instrumented
+    async def create(
+            self,
+            async_db: "AsyncSession",
+            obj_in: Union[dict, UserCreate],
+            refresh: Optional[bool] = None,
+            **kwargs
+    ) -> User:
+        data_in = await convert_user_data_async(obj_in)
         db_obj = self.model()  # type: ignore
 
         for field in data_in:
@@ -80,9 +234,53 @@ class CRUDUser(CRUDBase[User]):
 
         async_db.add(db_obj)
         await async_db.commit()
-        await async_db.refresh(db_obj)
+        invalidate_users(async_db, (db_obj.id,))
+        invalidate_login_misses(async_db, (data_in,))
+        await refresh_obj_async(async_db, db_obj, refresh)
         return db_obj
 
+    @instrumented
+    async def update(
+            self,
+            async_db: "AsyncSession",
+            *,
+            db_obj: User,
+            obj_in: Union[UserBase, dict],
+            refresh: Optional[bool] = None,
+    ) -> User:
+        db_obj = await super().update(async_db, db_obj=db_obj, obj_in=obj_in, refresh=refresh)
+        invalidate_users(async_db, (db_obj.id,))
+        invalidate_login_misses(async_db, (user_data(obj_in),))
+        return db_obj
+
+    @instrumented
+    async def delete(self, async_db: "AsyncSession", *, db_obj: User) -> User:
+        user_id = db_obj.id
+        db_obj = await super().delete(async_db, db_obj=db_obj)
+        invalidate_users(async_db, (user_id,))
+        return db_obj
+
+    async def bulk_create(
+            self, async_db: "AsyncSession", *, objs_in: Iterable[Union[dict, UserCreate]], **kwargs
+    ) -> Union[int, List[Any]]:
+        objs_in = await convert_users_data_async([user_data(obj_in) for obj_in in objs_in])
+        result = await super().bulk_create(async_db, objs_in=objs_in, **kwargs)
+        invalidate_login_misses(async_db, objs_in)
+        return result
+
+    async def bulk_update(self, async_db: "AsyncSession", *, objs_in: Iterable[dict], **kwargs) -> int:
+        objs_in = await convert_users_data_async([user_data(obj_in) for obj_in in objs_in])
+        count = await super().bulk_update(async_db, objs_in=objs_in, **kwargs)
+        invalidate_users(async_db, (obj_in.get('id') for obj_in in objs_in))
+        invalidate_login_misses(async_db, objs_in)
+        return count
+
+    async def bulk_delete(self, async_db: "AsyncSession", *, ids: Iterable[Any], **kwargs) -> int:
+        ids = list(ids)
+        count = await super().bulk_delete(async_db, ids=ids, **kwargs)
+        invalidate_users(async_db, ids)
+        return count
+
 
 user_repo_sync = CRUDUserSync(User)
 user_repo = CRUDUser(User)
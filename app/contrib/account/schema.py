@@ -1,7 +1,8 @@
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
-from pydantic import BaseModel as PydanticBaseModel, Field, EmailStr
+from pydantic import BaseModel as PydanticBaseModel, ConfigDict, Field, EmailStr
 
+from app.conf.config import jwt_settings
 from app.core.schema import BaseModel, VisibleBase
 
 
@@ -20,6 +21,9 @@ class UserVisible(VisibleBase):
 
 
 class TokenPayload(PydanticBaseModel):
+    # Shared by every request of the token through token_payload_cache
+    model_config = ConfigDict(frozen=True)
+
     user_id: int
     jti: Optional[UUID] = None
     iat: Optional[int] = None
@@ -39,6 +43,10 @@ class TokenBody(BaseModel):
     token: str
 
 
+class TokensBody(BaseModel):
+    tokens: List[str] = Field(..., min_length=1, max_length=jwt_settings.JWT_VERIFY_BATCH_MAX_SIZE)
+
+
 class RefreshTokenBody(BaseModel):
     refresh_token: str
     recreate_refresh_token: Optional[bool] = False
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.core.metrics import metrics
+
+__all__ = ('ExpiringLRUCache', 'register_cache_metrics')
+
+
+class ExpiringLRUCache:
+    """
+    In-process cache of values with an absolute expiry (unix timestamp). At most
+    `max_size` entries are kept, the least recently used one is evicted first,
+    `max_size` of 0 or None disables the cache.
+    """
+
+    def __init__(self, max_size: Optional[int] = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, now: Optional[float] = None) -> Optional[Any]:
+        """
+        Value of the key unless it is missing or expired
+        :param key:
+        :param now: unix timestamp, defaults to the current one
+        :return:
+        """
+        if not self.max_size:
+            return None
+        if now is None:
+            now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any, expires_at: float) -> None:
+        if not self.max_size:
+            return
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return None if entry is None else entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._entries)}
+
+
+def register_cache_metrics(name: str, cache: ExpiringLRUCache) -> None:
+    """
+    Expose hit, miss and eviction counters and size of the cache at scrape time
+    :param name: metric name prefix
+    :param cache:
+    :return:
+    """
+
+    @metrics.collector
+    def collect() -> Iterable[str]:
+        stats = cache.stats()
+        for field in ('hits', 'misses', 'evictions'):
+            yield f'# TYPE {name}_{field}_total counter'
+            yield f'{name}_{field}_total {stats[field]}'
+        yield f'# TYPE {name}_size gauge'
+        yield f'{name}_size {stats["size"]}'
@@ -71,3 +71,8 @@ class HTTP404(HTTPException):
 
 class DocumentRawNotFound(Exception):
     pass
+
+
+class PasswordHasherBusy(Exception):
+    """Password hashing pool and its queue are full"""
+    pass
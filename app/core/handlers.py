@@ -1,17 +1,23 @@
 from typing import TYPE_CHECKING
 from fastapi.responses import ORJSONResponse
-from starlette.status import HTTP_404_NOT_FOUND, HTTP_422_UNPROCESSABLE_ENTITY
+from starlette.status import HTTP_404_NOT_FOUND, HTTP_422_UNPROCESSABLE_ENTITY, HTTP_503_SERVICE_UNAVAILABLE
 
 if TYPE_CHECKING:
     from fastapi import Request
     from fastapi.exceptions import RequestValidationError
 
-    from .exceptions import DocumentRawNotFound
+    from .exceptions import DocumentRawNotFound, PasswordHasherBusy
 
 
 async def request_document_raw_not_found_exception(request: "Request", exc: "DocumentRawNotFound"):
     return ORJSONResponse(status_code=HTTP_404_NOT_FOUND, content={"detail": str(exc)})
 
 
+async def password_hasher_busy_exception(request: "Request", exc: "PasswordHasherBusy"):
+    return ORJSONResponse(
+        status_code=HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)}, headers={"Retry-After": "1"}
+    )
+
+
 # async def request_validation_error(request: "Request", exc: "RequestValidationError"):
 #     return ORJSONResponse(status_code=HTTP_422_UNPROCESSABLE_ENTITY, content=exc.errors())
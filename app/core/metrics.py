@@ -0,0 +1,109 @@
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+__all__ = ('Histogram', 'MetricsRegistry', 'metrics', 'DEFAULT_BUCKETS')
+
+DEFAULT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Histogram:
+    """
+    Cumulative histogram with labels, rendered in Prometheus text exposition format
+    """
+    __slots__ = ('name', 'documentation', 'label_names', 'buckets', '_series', '_lock')
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            label_names: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., sum, count]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def series(self, *labels: str) -> Optional[Dict[str, float]]:
+        series = self._series.get(labels)
+        if series is None:
+            return None
+        return {'sum': series[-2], 'count': series[-1]}
+
+    def collect(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        bucket_names = self.label_names + ('le',)
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f'{self.name}_bucket{format_labels(bucket_names, labels + (repr(float(bound)),))} {cumulative}'
+            yield f'{self.name}_bucket{format_labels(bucket_names, labels + ("+Inf",))} {series[-1]}'
+            yield f'{self.name}_sum{format_labels(self.label_names, labels)} {series[-2]}'
+            yield f'{self.name}_count{format_labels(self.label_names, labels)} {series[-1]}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms: Dict[str, Histogram] = {}
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            label_names: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = Histogram(name, documentation, label_names, buckets)
+        return histogram
+
+    def collector(self, func: Callable[[], Iterable[str]]) -> Callable[[], Iterable[str]]:
+        """
+        Register a callable yielding already formatted exposition lines at scrape time
+        :param func:
+        :return:
+        """
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for histogram in self._histograms.values():
+            lines.extend(histogram.collect())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,177 @@
+import time
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+from typing import Callable, Iterable, Optional, TYPE_CHECKING
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.metrics import metrics, format_labels
+
+if TYPE_CHECKING:
+    from sqlalchemy import Engine
+    from .session import TenantEngineRegistry
+
+__all__ = (
+    'repository_method', 'instrumented', 'instrument_engine', 'register_registry_metrics',
+    'InstrumentedQueuePool', 'InstrumentedAsyncAdaptedQueuePool',
+)
+
+ROWS_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000)
+
+repository_method: ContextVar[str] = ContextVar('repository_method', default='')
+
+checkout_wait = metrics.histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection', ('tenant',)
+)
+connection_hold = metrics.histogram(
+    'db_pool_connection_hold_seconds', 'Time a connection stayed checked out', ('tenant',)
+)
+query_duration = metrics.histogram(
+    'db_query_duration_seconds', 'Cursor execution time', ('tenant', 'method')
+)
+query_rows = metrics.histogram(
+    'db_query_rows', 'Rows returned or affected by a cursor execution', ('tenant', 'method'), ROWS_BUCKETS
+)
+
+
+def instrumented(func: Callable) -> Callable:
+    """
+    Tag queries executed inside a repository method with the method name
+    :param func:
+    :return:
+    """
+    name = func.__name__
+
+    if iscoroutinefunction(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = repository_method.set(name)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                repository_method.reset(token)
+    else:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            token = repository_method.set(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                repository_method.reset(token)
+    return wrapper
+
+
+class InstrumentedPoolMixin:
+    """
+    Measure how long `connect` waits for a connection, pool events fire only after
+    the connection has been acquired
+    """
+    tenant: str = ''
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            checkout_wait.observe(time.perf_counter() - start, self.tenant)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.tenant = self.tenant
+        return pool
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _tenant(conn) -> str:
+    translate_map = conn.get_execution_options().get('schema_translate_map')
+    if translate_map and translate_map.get(None):
+        return translate_map[None]
+    return conn.engine.url.database or ''
+
+
+def on_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+    connection_record.info['checkout_time'] = time.perf_counter()
+
+
+def on_checkin(connection_record, tenant: str) -> None:
+    checkout_time = connection_record.info.pop('checkout_time', None)
+    if checkout_time is not None:
+        connection_hold.observe(time.perf_counter() - checkout_time, tenant)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    # Kept on the execution context, a failed query leaves nothing behind on the pooled connection
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    start = getattr(context, '_query_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    tenant = _tenant(conn)
+    method = repository_method.get()
+    query_duration.observe(elapsed, tenant, method)
+    if cursor.rowcount is not None and cursor.rowcount >= 0:
+        query_rows.observe(cursor.rowcount, tenant, method)
+
+
+def instrument_engine(engine: "Engine", tenant: Optional[str]) -> None:
+    """
+    Attach pool and cursor listeners of the metrics to the engine
+    :param engine: sync engine, `AsyncEngine.sync_engine` for async ones
+    :param tenant:
+    :return:
+    """
+    tenant = tenant or ''
+    if isinstance(engine.pool, InstrumentedPoolMixin):
+        engine.pool.tenant = tenant
+
+    def checkin(dbapi_connection, connection_record):
+        on_checkin(connection_record, tenant)
+
+    event.listen(engine, 'checkout', on_checkout)
+    event.listen(engine, 'checkin', checkin)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def register_registry_metrics(registry: "TenantEngineRegistry") -> None:
+    """
+    Expose tenant registry counters and pool saturation at scrape time
+    :param registry:
+    :return:
+    """
+
+    @metrics.collector
+    def collect() -> Iterable[str]:
+        stats = registry.stats()
+        for field in ('hits', 'misses', 'evictions'):
+            name = f'db_tenant_engine_{field}_total'
+            yield f'# TYPE {name} counter'
+            for tenant, values in stats.items():
+                yield f'{name}{format_labels(("tenant",), (tenant,))} {values[field]}'
+
+        pools = {}
+        for async_engine in registry.engines().values():
+            pool = async_engine.sync_engine.pool
+            pools[id(pool)] = (async_engine.sync_engine.url.database or '', pool)
+        for name, getter in (
+                ('db_pool_checked_out', lambda p: p.checkedout()),
+                ('db_pool_size', lambda p: p.size()),
+                ('db_pool_overflow', lambda p: p.overflow()),
+        ):
+            yield f'# TYPE {name} gauge'
+            for tenant, pool in pools.values():
+                if hasattr(pool, 'checkedout'):
+                    yield f'{name}{format_labels(("tenant",), (tenant,))} {getter(pool)}'
@@ -1,17 +1,26 @@
+import base64
+import binascii
+import json
+from functools import lru_cache
+from itertools import islice
 from typing import (
     Generic, Optional, Type, TypeVar, Union, Any, TYPE_CHECKING, Iterable,
-    Dict
+    Dict, Tuple, Iterator, List
 )
 from uuid import UUID
-from sqlalchemy import func, select, text, delete
+from weakref import WeakKeyDictionary
+from sqlalchemy import func, select, text, delete, bindparam, insert, update, tuple_, and_, or_
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 
 from app.core.enums import Choices
 
+from .instrumentation import instrumented
 from .models import Base
 
 if TYPE_CHECKING:
+    from sqlalchemy import Select, Update, Table, Column, CursorResult
+    from sqlalchemy.engine import Dialect, Engine
     from sqlalchemy.orm import Session
     from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -20,6 +29,234 @@ BaseSchemaType = TypeVar("BaseSchemaType", bound=BaseModel)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+# Statement shapes kept per repository, shapes beyond it are built on every call
+STATEMENT_CACHE_SIZE = 256
+# Rows per statement of bulk_create, bulk_update and bulk_delete
+BULK_CHUNK_SIZE = 500
+
+
+@lru_cache(maxsize=None)
+def server_generated_attributes(model: Type[Base], on_update: bool = False) -> Tuple[str, ...]:
+    """
+    Attributes of the model filled by the database which a write cannot know without reading back.
+    The primary key is not among them, the ORM takes it from lastrowid after the INSERT.
+    """
+    names = []
+    for attr in model.__mapper__.column_attrs:
+        for column in attr.columns:
+            if column.primary_key:
+                continue
+            if (
+                    column.server_onupdate is not None
+                    or column.computed is not None
+                    or (not on_update and column.server_default is not None)
+            ):
+                names.append(attr.key)
+                break
+    return tuple(names)
+
+
+def expires_on_commit(db: Union["Session", "AsyncSession"]) -> bool:
+    """
+    Whether a commit of the sync or async session expires all of its objects
+    """
+    return getattr(db, 'sync_session', db).expire_on_commit
+
+
+def refresh_obj(db: "Session", db_obj: Base, refresh: Optional[bool] = None, on_update: bool = False) -> None:
+    """
+    refresh=None reads back only server generated attributes, True the whole object, False nothing.
+    Objects of `expire_on_commit` sessions are expired by the commit, refresh=None reloads them whole.
+    """
+    if refresh is None and expires_on_commit(db):
+        refresh = True
+    if refresh is None:
+        attribute_names = server_generated_attributes(type(db_obj), on_update)
+        if attribute_names:
+            db.refresh(db_obj, attribute_names=attribute_names)
+    elif refresh:
+        db.refresh(db_obj)
+
+
+async def refresh_obj_async(
+        async_db: "AsyncSession", db_obj: Base, refresh: Optional[bool] = None, on_update: bool = False
+) -> None:
+    if refresh is None and expires_on_commit(async_db):
+        refresh = True
+    if refresh is None:
+        attribute_names = server_generated_attributes(type(db_obj), on_update)
+        if attribute_names:
+            await async_db.refresh(db_obj, attribute_names=attribute_names)
+    elif refresh:
+        await async_db.refresh(db_obj)
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_insert_statement(
+        table: "Table", rows: List[dict], primary_key: "Column", dialect: "Dialect", return_ids: bool
+):
+    """
+    Multi row INSERT of the chunk. When ids are requested they are read from
+    RETURNING if the dialect supports it, MySQL reports the first id of the
+    statement in lastrowid and assigns the following ones `auto_increment_increment` apart.
+    """
+    stmt = insert(table).values(rows)
+    if return_ids and dialect.name != 'mysql' and dialect.insert_returning and supplied_ids(rows, primary_key) is None:
+        stmt = stmt.returning(primary_key)
+    return stmt
+
+
+def supplied_ids(rows: List[dict], primary_key: "Column") -> Optional[List[Any]]:
+    ids = [row.get(primary_key.key) for row in rows]
+    return None if None in ids else ids
+
+
+# @@auto_increment_increment per MySQL engine, read once by bulk_create
+_auto_increment_increments: "WeakKeyDictionary[Engine, int]" = WeakKeyDictionary()
+AUTO_INCREMENT_INCREMENT_QUERY = text("SELECT @@auto_increment_increment")
+
+
+def auto_increment_increment(db: "Session") -> int:
+    engine = db.get_bind().engine
+    if engine not in _auto_increment_increments:
+        _auto_increment_increments[engine] = db.execute(AUTO_INCREMENT_INCREMENT_QUERY).scalar_one()
+    return _auto_increment_increments[engine]
+
+
+async def auto_increment_increment_async(async_db: "AsyncSession") -> int:
+    engine = async_db.get_bind().engine
+    if engine not in _auto_increment_increments:
+        result = await async_db.execute(AUTO_INCREMENT_INCREMENT_QUERY)
+        _auto_increment_increments[engine] = result.scalar_one()
+    return _auto_increment_increments[engine]
+
+
+def inserted_ids(
+        result: "CursorResult", rows: List[dict], primary_key: "Column", dialect: "Dialect", increment: int = 1
+) -> List[Any]:
+    """
+    Primary keys of the rows inserted by bulk_insert_statement, in the order of the rows.
+    Ids supplied by every row are returned as they are.
+    :param result:
+    :param rows:
+    :param primary_key:
+    :param dialect:
+    :param increment: MySQL auto_increment_increment
+    :return:
+    """
+    ids = supplied_ids(rows, primary_key)
+    if ids is not None:
+        return ids
+    if dialect.name == 'mysql':
+        if any(row.get(primary_key.key) is not None for row in rows):
+            raise ValueError("MySQL bulk inserts cannot return ids of rows mixing supplied and generated ids")
+        return [result.lastrowid + i * increment for i in range(len(rows))]
+    if dialect.insert_returning:
+        return list(result.scalars().all())
+    raise ValueError(f"Inserted ids are not available for {dialect.name} bulk inserts, use return_ids=False")
+
+
+def bulk_update_statements(
+        table: "Table", rows: Iterable[dict], primary_key: "Column", chunk_size: int
+) -> Iterator[Tuple["Update", List[dict]]]:
+    """
+    Group rows by their updated columns and yield executemany UPDATE statements
+    matching rows by primary key with bind parameters
+    """
+    groups: Dict[Tuple[str, ...], List[dict]] = {}
+    for row in rows:
+        keys = tuple(sorted(key for key in row if key != primary_key.key))
+        if keys:
+            groups.setdefault(keys, []).append(row)
+    for keys, group in groups.items():
+        stmt = update(table).where(primary_key == bindparam('b_pk')).values(
+            {key: bindparam(f'b_{key}') for key in keys}
+        )
+        for chunk in chunked(group, chunk_size):
+            params = []
+            for row in chunk:
+                values = {f'b_{key}': row[key] for key in keys}
+                values['b_pk'] = row[primary_key.key]
+                params.append(values)
+            yield stmt, params
+
+
+def keyset_order(model: Type[Base], order_by: Optional[Iterable[str]] = None) -> List[Tuple[str, bool]]:
+    """
+    (attribute, descending) sort keys of keyset pagination from `-name`/`name` strings.
+    The primary key is appended as tie breaker, so every row has a unique position.
+    Sort keys must be non-nullable columns.
+    """
+    mapper = model.__mapper__
+    keys = []
+    for name in order_by or ('-' + mapper.get_property_by_column(mapper.primary_key[0]).key,):
+        descending = name.startswith('-')
+        name = name[1:] if descending else name
+        if name not in mapper.column_attrs:
+            raise ValueError(f"Unknown sort key {name}")
+        keys.append((name, descending))
+    primary_key = mapper.get_property_by_column(mapper.primary_key[0]).key
+    if primary_key not in [name for name, _ in keys]:
+        keys.append((primary_key, keys[-1][1]))
+    return keys
+
+
+def encode_cursor(keys: List[Tuple[str, bool]], values: List[Any]) -> str:
+    data = json.dumps({'k': keys, 'v': values}, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: str, keys: List[Tuple[str, bool]]) -> List[Any]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        cursor_keys = [(name, descending) for name, descending in data['k']]
+        values = data['v']
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise ValueError("Invalid cursor")
+    if cursor_keys != keys or len(values) != len(keys):
+        raise ValueError("Cursor does not match the sort order")
+    return values
+
+
+def keyset_statement(
+        model: Type[Base], stmt: "Select", keys: List[Tuple[str, bool]], cursor: Optional[str], limit: int
+) -> "Select":
+    """
+    Order the statement by the sort keys and seek past the cursor row, reading one extra
+    row to know whether a next page exists
+    """
+    columns = [getattr(model, name) for name, _ in keys]
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        directions = {descending for _, descending in keys}
+        if len(directions) == 1:
+            # Row value comparison, an index on the sort keys is used for the seek
+            row, after = tuple_(*columns), tuple_(*values)
+            stmt = stmt.filter(row < after if keys[0][1] else row > after)
+        else:
+            clauses = []
+            for i, (column, (_, descending)) in enumerate(zip(columns, keys)):
+                equals = [previous == value for previous, value in zip(columns[:i], values[:i])]
+                clauses.append(and_(*equals, column < values[i] if descending else column > values[i]))
+            stmt = stmt.filter(or_(*clauses))
+    order = [column.desc() if descending else column.asc() for column, (_, descending) in zip(columns, keys)]
+    return stmt.order_by(*order).limit(limit + 1)
+
+
+def keyset_page(items: List[Any], keys: List[Tuple[str, bool]], limit: int) -> Tuple[List[Any], Optional[str]]:
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor(keys, [getattr(items[-1], name) for name, _ in keys])
+
 
 class CRUDBaseSync(Generic[ModelType]):
     __slots__ = ('model', 'primary_field')
@@ -37,6 +274,7 @@ class CRUDBaseSync(Generic[ModelType]):
         self.model = model
         self.primary_field = primary_field
 
+    @instrumented
     def first(
             self,
             db: "Session",
@@ -66,14 +304,16 @@ class CRUDBaseSync(Generic[ModelType]):
             stmt = stmt.order_by(*order_by)
         return db.execute(stmt).scalars().first()
 
-    def create(self, db: "Session", obj_in: dict) -> ModelType:
+    @instrumented
+    def create(self, db: "Session", obj_in: dict, refresh: Optional[bool] = None) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in, custom_encoder={Choices: lambda x: x.value})
         db_obj = self.model(**obj_in_data)  # type: ignore
         db.add(db_obj)
         db.commit()
-        db.refresh(db_obj)
+        refresh_obj(db, db_obj, refresh)
         return db_obj
 
+    @instrumented
     def count(
             self, db: "Session", *,
             expressions: Optional[list] = None,
@@ -96,6 +336,7 @@ class CRUDBaseSync(Generic[ModelType]):
             stmt = stmt.filter_by(**params)
         return db.execute(stmt).scalar_one()
 
+    @instrumented
     def exists(
             self, db: "Session",
             expressions: Optional[Iterable] = None,
@@ -115,6 +356,7 @@ class CRUDBaseSync(Generic[ModelType]):
             stmt = stmt.filter_by(**params)
         return db.execute(select(stmt.exists())).scalar_one()
 
+    @instrumented
     def get_all(
             self,
             db: "Session",
@@ -154,6 +396,42 @@ class CRUDBaseSync(Generic[ModelType]):
         result = db.execute(stmt).scalars().fetchall()
         return result
 
+    @instrumented
+    def get_all_keyset(
+            self,
+            db: "Session",
+            *,
+            cursor: Optional[str] = None,
+            limit: int = 100,
+            q: Optional[dict] = None,
+            order_by: Optional[Iterable[str]] = None,
+            options: Optional[Iterable] = None,
+            expressions: Optional[Iterable] = None,
+    ) -> Tuple[List[ModelType], Optional[str]]:
+        """
+        Keyset (seek) pagination, the page is found through the sort key index
+        instead of scanning and discarding `offset` rows
+        :param db: sqlalchemy.orm.Session
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param limit:
+        :param q:
+        :param order_by: column names, `-` prefix for descending order, defaults to -id
+        :param options:
+        :param expressions:
+        :return: items and the cursor of the next page, None on the last page
+        """
+        keys = keyset_order(self.model, order_by)
+        stmt = select(self.model)
+        if options:
+            stmt = stmt.options(*options)
+        if expressions:
+            stmt = stmt.filter(*expressions)
+        if q:
+            stmt = stmt.filter_by(**q)
+        stmt = keyset_statement(self.model, stmt, keys, cursor, limit)
+        return keyset_page(db.execute(stmt).scalars().fetchall(), keys, limit)
+
+    @instrumented
     def get_by_params(
             self, db: "Session",
 
@@ -175,6 +453,7 @@ class CRUDBaseSync(Generic[ModelType]):
 
         return result.scalar_one()
 
+    @instrumented
     def get(
             self,
             db: "Session",
@@ -193,10 +472,12 @@ class CRUDBaseSync(Generic[ModelType]):
         return result.scalar_one()
 
     @staticmethod
+    @instrumented
     def update(
             db: "Session",
             db_obj: ModelType,
-            obj_in: Dict[str, Any]
+            obj_in: Dict[str, Any],
+            refresh: Optional[bool] = None,
     ) -> ModelType:
         obj_data = jsonable_encoder(db_obj, custom_encoder={Choices: lambda x: x.value})
         obj_in = jsonable_encoder(obj_in, custom_encoder={Choices: lambda x: x.value})
@@ -205,10 +486,11 @@ class CRUDBaseSync(Generic[ModelType]):
                 setattr(db_obj, field, obj_in[field])
         db.add(db_obj)
         db.commit()
-        db.refresh(db_obj)
+        refresh_obj(db, db_obj, refresh, on_update=True)
         return db_obj
 
     @staticmethod
+    @instrumented
     def delete(
             db: "Session",
             db_obj: ModelType
@@ -223,15 +505,109 @@ class CRUDBaseSync(Generic[ModelType]):
         db.commit()
         return db_obj
 
+    @instrumented
     def remove(self, db: "Session", expressions: list):
         statement = delete(self.model).where(*expressions)
         result = db.execute(statement)
         db.commit()
         return result
 
+    @instrumented
+    def bulk_create(
+            self,
+            db: "Session",
+            objs_in: Iterable[Union[dict, BaseModel]],
+            *,
+            chunk_size: int = BULK_CHUNK_SIZE,
+            return_ids: bool = False,
+    ) -> Union[int, List[Any]]:
+        """
+        Insert rows with multi row INSERT statements of `chunk_size` rows in one transaction
+        :param db:
+        :param objs_in: rows, every row must have the same keys
+        :param chunk_size:
+        :param return_ids: return inserted primary keys instead of the row count
+        :return:
+        """
+        table = self.model.__table__
+        primary_key = self.model.__mapper__.primary_key[0]
+        dialect = db.get_bind().dialect
+        ids: List[Any] = []
+        count = 0
+        try:
+            increment = auto_increment_increment(db) if return_ids and dialect.name == 'mysql' else 1
+            for chunk in chunked(objs_in, chunk_size):
+                rows = [
+                    jsonable_encoder(obj_in, custom_encoder={Choices: lambda x: x.value}) for obj_in in chunk
+                ]
+                result = db.execute(bulk_insert_statement(table, rows, primary_key, dialect, return_ids))
+                if return_ids:
+                    ids.extend(inserted_ids(result, rows, primary_key, dialect, increment))
+                count += len(rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return ids if return_ids else count
+
+    @instrumented
+    def bulk_update(
+            self,
+            db: "Session",
+            objs_in: Iterable[Dict[str, Any]],
+            *,
+            chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        """
+        Update rows matched by the primary key of every dict in one transaction
+        :param db:
+        :param objs_in: dicts with the primary key and the columns to update
+        :param chunk_size:
+        :return: number of matched rows
+        """
+        table = self.model.__table__
+        primary_key = self.model.__mapper__.primary_key[0]
+        rows = (jsonable_encoder(obj_in, custom_encoder={Choices: lambda x: x.value}) for obj_in in objs_in)
+        count = 0
+        try:
+            for stmt, params in bulk_update_statements(table, rows, primary_key, chunk_size):
+                count += db.execute(stmt, params).rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return count
+
+    @instrumented
+    def bulk_delete(
+            self,
+            db: "Session",
+            ids: Iterable[Any],
+            *,
+            chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        """
+        Delete rows by primary key with `IN` chunks in one transaction
+        :param db:
+        :param ids:
+        :param chunk_size:
+        :return: number of deleted rows
+        """
+        table = self.model.__table__
+        primary_key = self.model.__mapper__.primary_key[0]
+        count = 0
+        try:
+            for chunk in chunked(ids, chunk_size):
+                count += db.execute(delete(table).where(primary_key.in_(chunk))).rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return count
+
 
 class CRUDBase(Generic[ModelType]):
-    __slots__ = ('model', 'primary_field')
+    __slots__ = ('model', 'primary_field', '_statements')
 
     def __init__(self, model: Type[ModelType]):
         """
@@ -244,7 +620,37 @@ class CRUDBase(Generic[ModelType]):
         * `schema`: A Pydantic model (schema) class
         """
         self.model = model
-
+        self._statements: Dict[Tuple[str, Tuple[str, ...], Tuple[str, ...]], "Select"] = {}
+
+    def _statement(self, kind: str, params: dict) -> Tuple["Select", Dict[str, Any]]:
+        """
+        Parameterized statement of `first`, `get`, `exists` and `count` without
+        options and expressions. Each (kind, filter keys) shape is built once with
+        bind parameters and reused, so SQLAlchemy skips rebuilding the select and
+        finds its compiled form in the engine compiled cache.
+        :param kind: first, get, exists or count
+        :param params: filter_by params
+        :return: statement and its bind values
+        """
+        keys = tuple(sorted(key for key, value in params.items() if value is not None))
+        null_keys = tuple(sorted(key for key, value in params.items() if value is None))
+        shape = (kind, keys, null_keys)
+        stmt = self._statements.get(shape)
+        if stmt is None:
+            criteria: Dict[str, Any] = {key: bindparam(f'param_{key}') for key in keys}
+            # Keep `IS NULL` rendering of filter_by for None values
+            criteria.update({key: None for key in null_keys})
+            if kind == 'count':
+                stmt = select(func.count(self.model.id)).filter_by(**criteria)
+            elif kind == 'exists':
+                stmt = select(select(self.model).filter_by(**criteria).exists())
+            else:
+                stmt = select(self.model).filter_by(**criteria)
+            if len(self._statements) < STATEMENT_CACHE_SIZE:
+                self._statements[shape] = stmt
+        return stmt, {f'param_{key}': params[key] for key in keys}
+
+    @instrumented
     async def count(
             self, async_db: "AsyncSession", *,
             expressions: Optional[Iterable] = (),
@@ -259,9 +665,14 @@ class CRUDBase(Generic[ModelType]):
         """
         if params is None:
             params = {}
+        if not expressions:
+            stmt, bind_values = self._statement('count', params)
+            query = await async_db.execute(stmt, bind_values)
+            return query.scalar_one()
         query = await async_db.execute(select(func.count(self.model.id)).filter(*expressions).filter_by(**params))
         return query.scalar_one()
 
+    @instrumented
     async def exists(
             self, async_db: "AsyncSession", *,
             expressions: Optional[Iterable] = (),
@@ -276,9 +687,14 @@ class CRUDBase(Generic[ModelType]):
         """
         if params is None:
             params = {}
+        if not expressions:
+            stmt, bind_values = self._statement('exists', params)
+            query = await async_db.execute(stmt, bind_values)
+            return query.scalar_one()
         query = await async_db.execute(select(select(self.model).filter(*expressions).filter_by(**params).exists()))
         return query.scalar_one()
 
+    @instrumented
     async def get_by_params(
             self, async_db: "AsyncSession",
             expressions: Optional[Iterable] = (),
@@ -299,6 +715,7 @@ class CRUDBase(Generic[ModelType]):
 
         return result.scalar_one()
 
+    @instrumented
     async def first(
             self,
             async_db: "AsyncSession",
@@ -317,10 +734,15 @@ class CRUDBase(Generic[ModelType]):
         """
         if params is None:
             params = {}
+        if not expressions and not options:
+            stmt, bind_values = self._statement('first', params)
+            result = await async_db.execute(stmt, bind_values)
+            return result.scalars().first()
         select_q = select(self.model).options(*options).filter(*expressions).filter_by(**params)
         result = await async_db.execute(select_q)
         return result.scalars().first()
 
+    @instrumented
     async def get(
             self,
             async_db: "AsyncSession",
@@ -334,10 +756,16 @@ class CRUDBase(Generic[ModelType]):
         :param obj_id:
         :return:
         """
+        if not options:
+            # Same shape as first(params={'id': ...})
+            stmt, bind_values = self._statement('first', {'id': obj_id})
+            result = await async_db.execute(stmt, bind_values)
+            return result.scalar_one()
         result = await async_db.execute(select(self.model).options(*options).where(self.model.id == obj_id))
 
         return result.scalar_one()
 
+    @instrumented
     async def get_all(
             self,
             async_db: "AsyncSession",
@@ -368,7 +796,45 @@ class CRUDBase(Generic[ModelType]):
         )
         return result.scalars().fetchall()
 
-    async def create(self, async_db: "AsyncSession", *, obj_in: Union[dict, CreateSchemaType]) -> ModelType:
+    @instrumented
+    async def get_all_keyset(
+            self,
+            async_db: "AsyncSession",
+            *,
+            cursor: Optional[str] = None,
+            limit: int = 100,
+            q: Optional[dict] = None,
+            order_by: Optional[Iterable[str]] = None,
+            options: Optional[Iterable] = (),
+            expressions: Optional[Iterable] = (),
+    ) -> Tuple[List[ModelType], Optional[str]]:
+        """
+        Keyset (seek) pagination, the page is found through the sort key index
+        instead of scanning and discarding `offset` rows
+        :param async_db:
+        :param cursor: next_cursor of the previous page, None for the first page
+        :param limit:
+        :param q:
+        :param order_by: column names, `-` prefix for descending order, defaults to -id
+        :param options:
+        :param expressions:
+        :return: items and the cursor of the next page, None on the last page
+        """
+        if q is None:
+            q = {}
+        keys = keyset_order(self.model, order_by)
+        stmt = select(self.model).options(*options).filter(*expressions).filter_by(**q)
+        result = await async_db.execute(keyset_statement(self.model, stmt, keys, cursor, limit))
+        return keyset_page(result.scalars().fetchall(), keys, limit)
+
+    @instrumented
+    async def create(
+            self,
+            async_db: "AsyncSession",
+            *,
+            obj_in: Union[dict, CreateSchemaType],
+            refresh: Optional[bool] = None,
+    ) -> ModelType:
         # obj_in_data = jsonable_encoder(obj_in, custom_encoder={Choices: lambda x: x.value})
         if isinstance(obj_in, dict):
             # obj_in_data = jsonable_encoder(obj_in, custom_encoder={Choices: lambda x: x.value})
@@ -378,15 +844,17 @@ class CRUDBase(Generic[ModelType]):
         db_obj = self.model(**obj_in_data)  # type: ignore
         async_db.add(db_obj)
         await async_db.commit()
-        await async_db.refresh(db_obj)
+        await refresh_obj_async(async_db, db_obj, refresh)
         return db_obj
 
     @staticmethod
+    @instrumented
     async def update(
             async_db: "AsyncSession",
             *,
             db_obj: ModelType,
-            obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+            obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+            refresh: Optional[bool] = None,
     ) -> ModelType:
         obj_data = jsonable_encoder(db_obj, custom_encoder={Choices: lambda x: x.value})
         if isinstance(obj_in, dict):
@@ -399,10 +867,11 @@ class CRUDBase(Generic[ModelType]):
                 setattr(db_obj, field, update_data[field])
         async_db.add(db_obj)
         await async_db.commit()
-        await async_db.refresh(db_obj)
+        await refresh_obj_async(async_db, db_obj, refresh, on_update=True)
         return db_obj
 
     @staticmethod
+    @instrumented
     async def delete(
             async_db: "AsyncSession", *,
             db_obj: Union[CreateSchemaType, Dict[str, Any]]
@@ -416,3 +885,98 @@ class CRUDBase(Generic[ModelType]):
         await async_db.delete(db_obj)
         await async_db.commit()
         return db_obj
+
+    @instrumented
+    async def bulk_create(
+            self,
+            async_db: "AsyncSession",
+            *,
+            objs_in: Iterable[Union[dict, CreateSchemaType]],
+            chunk_size: int = BULK_CHUNK_SIZE,
+            return_ids: bool = False,
+    ) -> Union[int, List[Any]]:
+        """
+        Insert rows with multi row INSERT statements of `chunk_size` rows in one transaction
+        :param async_db:
+        :param objs_in: rows, every row must have the same keys
+        :param chunk_size:
+        :param return_ids: return inserted primary keys instead of the row count
+        :return:
+        """
+        table = self.model.__table__
+        primary_key = self.model.__mapper__.primary_key[0]
+        dialect = async_db.get_bind().dialect
+        ids: List[Any] = []
+        count = 0
+        try:
+            increment = (
+                await auto_increment_increment_async(async_db) if return_ids and dialect.name == 'mysql' else 1
+            )
+            for chunk in chunked(objs_in, chunk_size):
+                rows = [obj_in if isinstance(obj_in, dict) else obj_in.model_dump() for obj_in in chunk]
+                result = await async_db.execute(bulk_insert_statement(table, rows, primary_key, dialect, return_ids))
+                if return_ids:
+                    ids.extend(inserted_ids(result, rows, primary_key, dialect, increment))
+                count += len(rows)
+            await async_db.commit()
+        except Exception:
+            await async_db.rollback()
+            raise
+        return ids if return_ids else count
+
+    @instrumented
+    async def bulk_update(
+            self,
+            async_db: "AsyncSession",
+            *,
+            objs_in: Iterable[Union[Dict[str, Any], UpdateSchemaType]],
+            chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        """
+        Update rows matched by the primary key of every item in one transaction
+        :param async_db:
+        :param objs_in: items with the primary key and the columns to update
+        :param chunk_size:
+        :return: number of matched rows
+        """
+        table = self.model.__table__
+        primary_key = self.model.__mapper__.primary_key[0]
+        rows = (obj_in if isinstance(obj_in, dict) else obj_in.model_dump(exclude_unset=True) for obj_in in objs_in)
+        count = 0
+        try:
+            for stmt, params in bulk_update_statements(table, rows, primary_key, chunk_size):
+                result = await async_db.execute(stmt, params)
+                count += result.rowcount
+            await async_db.commit()
+        except Exception:
+            await async_db.rollback()
+            raise
+        return count
+
+    @instrumented
+    async def bulk_delete(
+            self,
+            async_db: "AsyncSession",
+            *,
+            ids: Iterable[Any],
+            chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        """
+        Delete rows by primary key with `IN` chunks in one transaction
+        :param async_db:
+        :param ids:
+        :param chunk_size:
+        :return: number of deleted rows
+        """
+        table = self.model.__table__
+        primary_key = self.model.__mapper__.primary_key[0]
+        count = 0
+        try:
+            for chunk in chunked(ids, chunk_size):
+                result = await async_db.execute(delete(table).where(primary_key.in_(chunk)))
+                count += result.rowcount
+            await async_db.commit()
+        except Exception:
+            await async_db.rollback()
+            raise
+        return count
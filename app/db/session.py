@@ -1,12 +1,29 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union, TYPE_CHECKING
+
 from pydantic import MySQLDsn
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker, AsyncEngine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, Engine
+from sqlalchemy.exc import DisconnectionError
 
 from app.conf.config import settings
 
+from .instrumentation import (
+    InstrumentedAsyncAdaptedQueuePool, InstrumentedQueuePool, instrument_engine, register_registry_metrics
+)
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Dialect
+
+logger = logging.getLogger(__name__)
+
 
-def get_database_uri(database: str):
+def get_database_uri(database: Optional[str]):
     return MySQLDsn.build(
         scheme='mysql+aiomysql',
         host=settings.DATABASE_HOST,
@@ -17,20 +34,92 @@ def get_database_uri(database: str):
     )
 
 
-def get_async_session(database: str):
-    database_uri = str(get_database_uri(database))
-    async_engine = create_async_engine(database_uri, pool_pre_ping=True, echo=False)
+def get_engine_options(database: Optional[str]) -> Dict[str, Any]:
+    """
+    Pool options of the database engine, settings defaults updated with per tenant overrides
+    :param database:
+    :return:
+    """
+    options = {
+        'pool_size': settings.DATABASE_POOL_SIZE,
+        'max_overflow': settings.DATABASE_MAX_OVERFLOW,
+        'pool_recycle': settings.DATABASE_POOL_RECYCLE,
+        'pool_timeout': settings.DATABASE_POOL_TIMEOUT,
+        'pool_use_lifo': settings.DATABASE_POOL_USE_LIFO,
+        'pool_pre_ping': settings.DATABASE_POOL_PRE_PING,
+        'pool_pre_ping_idle': settings.DATABASE_POOL_PRE_PING_IDLE,
+    }
+    if settings.DATABASE_POOL_OVERRIDES and database in settings.DATABASE_POOL_OVERRIDES:
+        options.update(settings.DATABASE_POOL_OVERRIDES[database])
+    return options
 
-    db_uri = database_uri.replace('+aiomysql', '+pymysql')
-    engine = create_engine(db_uri, pool_pre_ping=True, echo=False)
 
-    session_local = sessionmaker(
-        expire_on_commit=True,
-        autocommit=False,
-        autoflush=False,
-        # twophase=True,
-        bind=engine
-    )
+def ping_if_idle(idle_seconds: float, dialect: "Dialect") -> Callable:
+    """
+    Pool checkout listener which pings only connections that stayed in the pool
+    longer than `idle_seconds`. Busy pools skip the extra round trip of
+    `pool_pre_ping`, stale connections are still replaced before use.
+    :param idle_seconds:
+    :param dialect:
+    :return:
+    """
+
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        checkin_time = connection_record.info.get('checkin_time')
+        if checkin_time is None or time.monotonic() - checkin_time < idle_seconds:
+            return
+        try:
+            dialect.do_ping(dbapi_connection)
+        except Exception:
+            # Pool retries the checkout with a new connection
+            raise DisconnectionError()
+
+    return checkout
+
+
+def record_checkin_time(dbapi_connection, connection_record) -> None:
+    connection_record.info['checkin_time'] = time.monotonic()
+
+
+def create_tenant_engine(database_uri: str, database: Optional[str], is_async: Optional[bool] = True):
+    options = get_engine_options(database)
+    pre_ping_idle = options.pop('pool_pre_ping_idle', 0)
+    if pre_ping_idle and pre_ping_idle > 0:
+        options['pool_pre_ping'] = False
+    if settings.DATABASE_INSTRUMENTATION:
+        options.setdefault('poolclass', InstrumentedAsyncAdaptedQueuePool if is_async else InstrumentedQueuePool)
+    if is_async:
+        async_engine = create_async_engine(database_uri, echo=False, **options)
+        engine = async_engine.sync_engine
+    else:
+        async_engine = engine = create_engine(database_uri, echo=False, **options)
+    if settings.DATABASE_INSTRUMENTATION:
+        instrument_engine(engine, database)
+    if pre_ping_idle and pre_ping_idle > 0:
+        event.listen(engine, 'checkin', record_checkin_time)
+        event.listen(engine, 'checkout', ping_if_idle(pre_ping_idle, engine.dialect))
+    return async_engine
+
+
+def session_tenant(db: Any) -> Optional[str]:
+    """
+    Tenant (database or translated schema) a sync or async session is bound to
+    :param db:
+    :return:
+    """
+    bind = db.bind
+    if bind is None:
+        return None
+    engine = getattr(bind, 'sync_engine', bind)
+    translate_map = engine.get_execution_options().get('schema_translate_map')
+    if translate_map and translate_map.get(None):
+        return translate_map[None]
+    return engine.url.database
+
+
+def get_async_session(database: Optional[str]):
+    database_uri = str(get_database_uri(database))
+    async_engine = create_tenant_engine(database_uri, database)
 
     async_session_local = async_sessionmaker(
         class_=AsyncSession,
@@ -38,6 +127,266 @@ def get_async_session(database: str):
         autocommit=False,
         autoflush=False,
         bind=async_engine,
-        sync_session_class=session_local
     )
     return async_session_local, async_engine
+
+
+def get_sync_session(database: Optional[str]):
+    db_uri = str(get_database_uri(database)).replace('+aiomysql', '+pymysql')
+    engine = create_tenant_engine(db_uri, database, is_async=False)
+
+    session_local = sessionmaker(
+        expire_on_commit=True,
+        autocommit=False,
+        autoflush=False,
+        # twophase=True,
+        bind=engine
+    )
+    return session_local, engine
+
+
+class TenantStats:
+    __slots__ = ('hits', 'misses', 'evictions')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class TenantEngineRegistry:
+    """
+    Process-wide registry of tenant engines keyed by database (audience) name.
+
+    Every gunicorn worker builds the engine and session factory of a tenant once,
+    on first use, and reuses its connection pool for all following requests.
+    At most `max_engines` tenants are kept alive, the least recently used one is
+    evicted when the limit is reached and tenants idle for longer than
+    `idle_timeout` seconds are closed by `reap_idle`. Evicted pools are disposed
+    in a background task, so the request which caused the eviction does not wait.
+    Pools with connections still checked out are kept until a later `reap_idle`
+    finds all of them returned. Sync engines built by `get_sync` follow the same
+    limit and idle timeout in a cache of their own.
+
+    With `routing="schema"` all tenants share a single pool to the MySQL host and
+    the session of a tenant translates unqualified tables into its schema
+    (`schema_translate_map`). Pooled connections never switch database, so there
+    is nothing to reset on checkin, and evicting a tenant keeps the shared pool.
+    """
+
+    def __init__(
+            self,
+            max_engines: Optional[int] = None,
+            idle_timeout: Optional[float] = None,
+            routing: Optional[str] = "database",
+    ):
+        self.max_engines = max_engines
+        self.idle_timeout = idle_timeout
+        self.routing = routing
+        self._shared: Optional[Tuple[async_sessionmaker, AsyncEngine]] = None
+        self._sync_tenants: "OrderedDict[str, Tuple[sessionmaker, Engine]]" = OrderedDict()
+        self._sync_last_used: Dict[str, float] = {}
+        self._sync_retired: List[Engine] = []
+        self._tenants: "OrderedDict[str, Tuple[async_sessionmaker, AsyncEngine]]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._stats: Dict[str, TenantStats] = {}
+        self._retired: List[AsyncEngine] = []
+        self._disposing: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+
+    def __contains__(self, database: str) -> bool:
+        return database in self._tenants
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def get(self, database: str) -> Tuple[async_sessionmaker, AsyncEngine]:
+        """
+        Retrieve session factory and engine of the database, build them on the first call
+        :param database:
+        :return:
+        """
+        with self._lock:
+            stats = self._stats.get(database)
+            if stats is None:
+                stats = self._stats[database] = TenantStats()
+            tenant = self._tenants.get(database)
+            if tenant is None:
+                stats.misses += 1
+                tenant = self._tenants[database] = self._build(database)
+                if self.max_engines and len(self._tenants) > self.max_engines:
+                    evicted, (_, evicted_engine) = self._tenants.popitem(last=False)
+                    del self._last_used[evicted]
+                    self._stats[evicted].evictions += 1
+                    self._retire(evicted_engine)
+            else:
+                stats.hits += 1
+                self._tenants.move_to_end(database)
+            self._last_used[database] = time.monotonic()
+        return tenant
+
+    def get_sync(self, database: str) -> Tuple[sessionmaker, Engine]:
+        """
+        Retrieve synchronous (PyMySQL) session factory and engine of the database.
+        They are only built when sync code such as `CRUDBaseSync` asks for them,
+        the async request path never creates a sync engine.
+        :param database:
+        :return:
+        """
+        evicted_engine = None
+        with self._lock:
+            tenant = self._sync_tenants.get(database)
+            if tenant is None:
+                tenant = self._sync_tenants[database] = get_sync_session(database)
+                if self.max_engines and len(self._sync_tenants) > self.max_engines:
+                    evicted, (_, evicted_engine) = self._sync_tenants.popitem(last=False)
+                    del self._sync_last_used[evicted]
+                    if self._checked_out(evicted_engine):
+                        self._sync_retired.append(evicted_engine)
+                        evicted_engine = None
+            else:
+                self._sync_tenants.move_to_end(database)
+            self._sync_last_used[database] = time.monotonic()
+        if evicted_engine is not None:
+            # Sync callers run in worker threads, the idle pool is closed right away
+            evicted_engine.dispose()
+        return tenant
+
+    def engines(self) -> Dict[str, AsyncEngine]:
+        """
+        Snapshot of live tenant engines
+        :return:
+        """
+        with self._lock:
+            return {database: async_engine for database, (_, async_engine) in self._tenants.items()}
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Hit, miss and eviction counters of every tenant seen by this worker
+        :return:
+        """
+        return {database: stats.as_dict() for database, stats in self._stats.items()}
+
+    def _build(self, database: str) -> Tuple[async_sessionmaker, AsyncEngine]:
+        if self.routing != "schema":
+            return get_async_session(database)
+        if self._shared is None:
+            self._shared = get_async_session(None)
+        shared_session_local, shared_engine = self._shared
+        async_engine = shared_engine.execution_options(schema_translate_map={None: database})
+        session_kw = dict(shared_session_local.kw, bind=async_engine)
+        return async_sessionmaker(class_=shared_session_local.class_, **session_kw), async_engine
+
+    @staticmethod
+    def _checked_out(engine: Union[AsyncEngine, Engine]) -> int:
+        checkedout = getattr(getattr(engine, 'sync_engine', engine).pool, 'checkedout', None)
+        return checkedout() if checkedout is not None else 0
+
+    def _retire(self, async_engine: AsyncEngine) -> None:
+        if self.routing == "schema":
+            # Tenant engines are views on the shared pool
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or self._checked_out(async_engine):
+            # Requests still hold connections of it, it is disposed by a later reap once they are back
+            self._retired.append(async_engine)
+            return
+        task = loop.create_task(async_engine.dispose())
+        self._disposing.add(task)
+        task.add_done_callback(self._disposing.discard)
+
+    async def reap_idle(self, now: Optional[float] = None) -> int:
+        """
+        Dispose tenants which have not been used for `idle_timeout` seconds, and engines
+        evicted earlier whose connections are all back in the pool
+        :param now: monotonic clock value, defaults to the current one
+        :return: number of reaped tenant engines, async and sync
+        """
+        if now is None:
+            now = time.monotonic()
+        reaped = 0
+        with self._lock:
+            retired, self._retired = self._retired, []
+            sync_retired, self._sync_retired = self._sync_retired, []
+            if self.idle_timeout:
+                for database, last_used in list(self._last_used.items()):
+                    if now - last_used >= self.idle_timeout:
+                        _, async_engine = self._tenants.pop(database)
+                        del self._last_used[database]
+                        self._stats[database].evictions += 1
+                        reaped += 1
+                        if self.routing != "schema":
+                            retired.append(async_engine)
+                for database, last_used in list(self._sync_last_used.items()):
+                    if now - last_used >= self.idle_timeout:
+                        _, engine = self._sync_tenants.pop(database)
+                        del self._sync_last_used[database]
+                        reaped += 1
+                        sync_retired.append(engine)
+        in_use = [async_engine for async_engine in retired if self._checked_out(async_engine)]
+        sync_in_use = [engine for engine in sync_retired if self._checked_out(engine)]
+        if in_use or sync_in_use:
+            with self._lock:
+                self._retired.extend(in_use)
+                self._sync_retired.extend(sync_in_use)
+        for async_engine in retired:
+            if async_engine not in in_use:
+                await async_engine.dispose()
+        for engine in sync_retired:
+            if engine not in sync_in_use:
+                engine.dispose()
+        return reaped
+
+    async def run_reaper(self, interval: float) -> None:
+        """
+        Reap idle tenants every `interval` seconds until cancelled
+        :param interval:
+        :return:
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap_idle()
+            except Exception as e:
+                logger.warning("Tenant engine reaping failed: %s", e)
+
+    async def dispose(self) -> None:
+        """
+        Close pooled connections of every registered tenant and forget them
+        :return:
+        """
+        with self._lock:
+            tenants, self._tenants = self._tenants, OrderedDict()
+            retired, self._retired = self._retired, []
+            self._last_used.clear()
+            sync_tenants, self._sync_tenants = self._sync_tenants, OrderedDict()
+            sync_retired, self._sync_retired = self._sync_retired, []
+            self._sync_last_used.clear()
+            if self._shared is not None:
+                retired.append(self._shared[1])
+                self._shared = None
+                tenants.clear()
+        if self._disposing:
+            await asyncio.gather(*self._disposing, return_exceptions=True)
+        for async_engine in retired:
+            await async_engine.dispose()
+        for _, async_engine in tenants.values():
+            await async_engine.dispose()
+        for _, engine in sync_tenants.values():
+            engine.dispose()
+        for engine in sync_retired:
+            engine.dispose()
+
+
+tenant_registry = TenantEngineRegistry(
+    max_engines=settings.DATABASE_TENANT_MAX_ENGINES,
+    idle_timeout=settings.DATABASE_TENANT_IDLE_TIMEOUT,
+    routing=settings.DATABASE_TENANT_ROUTING,
+)
+register_registry_metrics(tenant_registry)
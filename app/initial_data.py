@@ -5,9 +5,11 @@ logger = logging.getLogger(__name__)
 
 
 def init() -> None:
+    from app.conf.config import settings
     from app.db.init_db import init_db_sync
-    from app.db.session import SessionLocal
-    db = SessionLocal()
+    from app.db.session import tenant_registry
+    session_local, _ = tenant_registry.get_sync(settings.DATABASE_NAME)
+    db = session_local()
     init_db_sync(db)
 
 
@@ -1,5 +1,7 @@
+import asyncio
 import uvicorn
 
+from contextlib import asynccontextmanager
 from typing import Optional
 from fastapi import APIRouter, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,8 +9,13 @@ from fastapi.responses import ORJSONResponse
 from fastapi.routing import APIRoute
 
 from app.conf.config import settings
-from app.core.exceptions import DocumentRawNotFound
-from app.core.handlers import request_document_raw_not_found_exception
+from app.contrib.account.repository import rehash_tasks
+from app.core.exceptions import DocumentRawNotFound, PasswordHasherBusy
+from app.core.handlers import password_hasher_busy_exception, request_document_raw_not_found_exception
+from app.db.session import tenant_registry
+from app.utils.google import google_cert_cache
+from app.utils.hashing import password_hasher
+from app.utils.security import install_jwt_codec, shutdown_jwt_executor
 from app.routers.urls import router
 from app.routers.api import api
 
@@ -17,6 +24,25 @@ def custom_generate_unique_id(route: APIRoute):
     return route.name
 
 
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    install_jwt_codec()
+    reaper = None
+    # Evicted tenants in use are disposed by the reaper too
+    if settings.DATABASE_TENANT_IDLE_TIMEOUT or settings.DATABASE_TENANT_MAX_ENGINES:
+        reaper = asyncio.create_task(tenant_registry.run_reaper(settings.DATABASE_TENANT_REAP_INTERVAL))
+    yield
+    if reaper is not None:
+        reaper.cancel()
+    # Password hash upgrades write with the tenant engines, they finish before those are disposed
+    await asyncio.gather(*rehash_tasks, return_exceptions=True)
+    # Close pooled connections of all tenants on worker shutdown
+    await tenant_registry.dispose()
+    await google_cert_cache.aclose()
+    password_hasher.shutdown(wait=False)
+    shutdown_jwt_executor()
+
+
 def get_application(
         app_router: APIRouter,
         app_api: APIRouter,
@@ -36,7 +62,9 @@ def get_application(
         generate_unique_id_function=custom_generate_unique_id,
         exception_handlers={
             DocumentRawNotFound: request_document_raw_not_found_exception,
+            PasswordHasherBusy: password_hasher_busy_exception,
         },
+        lifespan=lifespan,
     )
     if settings.BACKEND_CORS_ORIGINS:
         application.add_middleware(
@@ -1,48 +1,30 @@
 from typing import Generator, Optional
 
 from fastapi import Depends, Request, HTTPException
-from fastapi.security.utils import get_authorization_scheme_param
 from pydantic import ValidationError
 from starlette.status import HTTP_401_UNAUTHORIZED
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from google.auth.exceptions import GoogleAuthError
-from google.oauth2 import id_token
-from google.auth.transport.requests import Request as GoogleRequest
 
+from app.contrib.account.cache import UserIdentity, user_cache
 from app.contrib.account.repository import user_repo
+from app.utils.google import verify_google_id_token
 from app.utils.jose import JWTError
-from app.utils.security import OAuth2PasswordBearerWithCookie
+from app.utils.security import OAuth2PasswordBearerWithCookie, get_request_credentials, token_payload_cache
 from app.conf.config import settings
 from app.contrib.account.schema import TokenPayload
-from app.core.exceptions import HTTPInvalidToken, HTTPPermissionDenied
-from app.db.session import get_async_session
+from app.core.exceptions import HTTPInvalidToken, HTTPPermissionDenied, PasswordHasherBusy
+from app.db.session import tenant_registry
 from app.utils.security import lazy_jwt_settings
-from app.contrib.account.models import User
 
 reusable_oauth2 = OAuth2PasswordBearerWithCookie(tokenUrl=f'{settings.API_V1_STR}/auth/get-token/', auto_error=False)
 
 
 async def get_google_id_token(request: Request):
-    header_authorization: str = request.headers.get(lazy_jwt_settings.JWT_GIT_HEADER_NAME)
-    cookie_authorization: str = request.cookies.get(lazy_jwt_settings.JWT_GIT_COOKIE_NAME)
-    header_scheme, header_param = get_authorization_scheme_param(header_authorization)
-    cookie_scheme, cookie_param = get_authorization_scheme_param(cookie_authorization)
-    if header_scheme.lower() == "bearer":
-        authorization = True
-        scheme = header_scheme
-        param = header_param
-    elif cookie_scheme.lower() == "bearer":
-        authorization = True
-        scheme = cookie_scheme
-        param = cookie_param
-    else:
-        authorization = False
-        scheme = ''
-        param = None
-
-    if not authorization or scheme.lower() != "bearer":
+    param = get_request_credentials(request).id_token
+    if param is None:
         if settings.MULTI_TENANCY_DB:
             raise HTTPException(
                 status_code=HTTP_401_UNAUTHORIZED,
@@ -58,7 +40,7 @@ async def get_audience(token: str = Depends(get_google_id_token)) -> Optional[st
     if not settings.MULTI_TENANCY_DB:
         return lazy_jwt_settings.JWT_AUDIENCE
     try:
-        id_info = id_token.verify_oauth2_token(token, GoogleRequest())
+        id_info = await verify_google_id_token(token)
     except GoogleAuthError as e:
         raise HTTPInvalidToken(detail=str(e))
     audience = id_info.get('aud')
@@ -70,19 +52,27 @@ async def get_audience(token: str = Depends(get_google_id_token)) -> Optional[st
 async def get_token_payload(
         token: str = Depends(reusable_oauth2),
 ) -> TokenPayload:
+    token_data = token_payload_cache.get(token) if token else None
+    if token_data is not None:
+        return token_data
     try:
         payload = lazy_jwt_settings.JWT_DECODE_HANDLER(token)
         token_data = TokenPayload(**payload)
     except (JWTError, ValidationError) as e:
         raise HTTPInvalidToken(detail=str(e))
+    # The whole token is the key, a reused signature with another payload never hits
+    token_payload_cache.set(token, token_data, token_data.exp)
     return token_data
 
 
 async def get_async_db(audience: str = Depends(get_audience)) -> Generator:
-    async_session_local, _ = get_async_session(audience)
+    async_session_local, _ = tenant_registry.get(audience)
     try:
         async with async_session_local() as session:
             yield session
+    except (HTTPException, PasswordHasherBusy):
+        # Served by their own handlers
+        raise
     except Exception as e:
         raise HTTPInvalidToken(detail=str(e), status_code=500)
     finally:
@@ -91,16 +81,21 @@ async def get_async_db(audience: str = Depends(get_audience)) -> Generator:
 
 async def get_current_user(
         token_payload: TokenPayload = Depends(get_token_payload),
+        audience: str = Depends(get_audience),
         async_db: AsyncSession = Depends(get_async_db),
-) -> User:
+) -> UserIdentity:
     """
-    Get user by token
+    Get user by token, served from the identity cache while it is fresh
     :param token_payload:
+    :param audience:
     :param async_db:
     :return:
     """
-    user = await user_repo.first(async_db=async_db, params={'id': token_payload.user_id})
-    if not user:
+    user = user_cache.get_user(audience, token_payload.user_id)
+    if user is not None:
+        return user
+    db_user = await user_repo.first(async_db=async_db, params={'id': token_payload.user_id})
+    if not db_user:
         raise HTTPInvalidToken(detail="Invalid token")
 
-    return user
+    return user_cache.set_user(audience, db_user)
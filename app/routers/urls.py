@@ -1,10 +1,33 @@
-from fastapi import APIRouter
-from fastapi.responses import FileResponse
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+from fastapi.security.utils import get_authorization_scheme_param
+from starlette.status import HTTP_404_NOT_FOUND
+
+from app.conf.config import settings
+from app.core.exceptions import HTTPUnAuthorized
+from app.core.metrics import metrics
 
 
 router = APIRouter()
 
 
+def verify_metrics_token(authorization: Optional[str] = Header(None)) -> None:
+    """
+    Only scrapers presenting `METRICS_TOKEN` as bearer token see the metrics, tenant names and
+    database timings are not public
+    :param authorization:
+    :return:
+    """
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, token = get_authorization_scheme_param(authorization)
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        raise HTTPUnAuthorized()
+
+
 @router.get('/', tags=['default'], name='root')
 async def root_path():
     return "Hello, from home page!!!"
@@ -13,3 +36,11 @@ async def root_path():
 @router.get('/favicon.ico', response_class=FileResponse, name='favicon', tags=['favicon'])
 async def favicon() -> str:
     return 'static/images/logo/favicon.ico'
+
+
+@router.get(
+    '/metrics', response_class=PlainTextResponse, name='metrics', include_in_schema=False,
+    dependencies=[Depends(verify_metrics_token)],
+)
+async def metrics_path() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import re
+import time
+from calendar import timegm
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Mapping, Optional, Set, Tuple, Union
+
+import httpx
+from google.auth.exceptions import GoogleAuthError, TransportError
+from starlette.concurrency import run_in_threadpool
+
+from app.conf.config import jwt_settings
+from app.core.cache import ExpiringLRUCache, register_cache_metrics
+from app.utils.jose import jwk, jws, jwt
+from app.utils.jose.backends.base import Key
+from app.utils.jose.constants import ALGORITHMS
+from app.utils.jose.exceptions import JWTError, JWKError
+
+__all__ = (
+    'GOOGLE_ISSUERS', 'GoogleCertCache', 'google_cert_cache', 'VerifiedTokenCache', 'google_token_cache',
+    'verify_google_id_token', 'parse_max_age',
+)
+
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+# Used when the certs response has no usable Cache-Control max-age
+DEFAULT_MAX_AGE = 300
+
+MAX_AGE_RE = re.compile(r'max-age\s*=\s*(\d+)', re.IGNORECASE)
+
+# Checks of google.auth.jwt.decode, the audience is read by the caller
+DECODE_OPTIONS = {
+    'verify_aud': False,
+    'verify_at_hash': False,
+    'require_iat': True,
+    'require_exp': True,
+    'leeway': 0,
+}
+
+
+def parse_max_age(cache_control: Optional[str]) -> Optional[int]:
+    if not cache_control:
+        return None
+    match = MAX_AGE_RE.search(cache_control)
+    if not match:
+        return None
+    return int(match.group(1))
+
+
+class GoogleCertCache:
+    """
+    Google ID token signing keys fetched once with `httpx.AsyncClient` and kept
+    for the `max-age` of the certs response. PEM certs are parsed into key
+    objects once per fetch. Keys close to expiry are refreshed in a background
+    task while the current ones keep being served, an unknown key id refetches
+    them immediately (at most once per `min_refetch_interval` seconds).
+    """
+
+    def __init__(
+            self,
+            certs_url: str,
+            fetch: Optional[Callable[[str], Awaitable[Tuple[Dict[str, str], Optional[int]]]]] = None,
+            refresh_before: float = 60,
+            min_refetch_interval: float = 30,
+    ):
+        self.certs_url = certs_url
+        self.fetch = fetch or self.fetch_certs
+        self.refresh_before = refresh_before
+        self.min_refetch_interval = min_refetch_interval
+        self._keys: Dict[str, Key] = {}
+        self._expires_at = 0.0
+        self._fetched_at: Optional[float] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+
+    async def fetch_certs(self, certs_url: str) -> Tuple[Dict[str, str], Optional[int]]:
+        """
+        Download Google signing certs
+        :param certs_url:
+        :return: certs by key id and max-age of the response
+        """
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10)
+        try:
+            response = await self._client.get(certs_url)
+        except httpx.HTTPError as e:
+            raise TransportError(f"Could not fetch certificates at {certs_url}: {e}")
+        if response.status_code != 200:
+            raise TransportError(f"Could not fetch certificates at {certs_url}")
+        try:
+            certs = response.json()
+        except ValueError as e:
+            raise TransportError(f"Invalid certificates at {certs_url}: {e}")
+        if not isinstance(certs, dict):
+            raise TransportError(f"Invalid certificates at {certs_url}")
+        return certs, parse_max_age(response.headers.get('cache-control'))
+
+    async def refresh(self) -> Dict[str, Key]:
+        # Concurrent callers share one in-flight fetch, it runs in a task of its own
+        # so a cancelled caller does not cancel it for the others
+        if self._refreshing is None:
+            self._refreshing = asyncio.get_running_loop().create_task(self._fetch_keys())
+            self._refreshing.add_done_callback(self._refresh_done)
+        return await asyncio.shield(self._refreshing)
+
+    async def _fetch_keys(self) -> Dict[str, Key]:
+        certs, max_age = await self.fetch(self.certs_url)
+        keys = {kid: jwk.construct(cert, ALGORITHMS.RS256) for kid, cert in certs.items()}
+        now = time.monotonic()
+        self._keys = keys
+        self._fetched_at = now
+        self._expires_at = now + (DEFAULT_MAX_AGE if max_age is None else max_age)
+        return keys
+
+    def _refresh_done(self, task: asyncio.Task) -> None:
+        self._refreshing = None
+        if not task.cancelled():
+            # Mark retrieved when every caller is gone, the next lookup retries
+            task.exception()
+
+    def _refresh_in_background(self) -> None:
+        if self._refreshing is not None:
+            return
+
+        async def run():
+            try:
+                await self.refresh()
+            except Exception:
+                # Served keys stay valid until expiry, the next lookup retries
+                pass
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def get_keys(self, kid: Optional[str] = None) -> Dict[str, Key]:
+        """
+        Keys by key id, fetched when missing, expired or not knowing `kid`
+        :param kid: key id of the token header
+        :return:
+        """
+        now = time.monotonic()
+        if now >= self._expires_at:
+            return await self.refresh()
+        if (
+                kid is not None and kid not in self._keys
+                and (self._fetched_at is None or now - self._fetched_at >= self.min_refetch_interval)
+        ):
+            return await self.refresh()
+        if now >= self._expires_at - self.refresh_before:
+            self._refresh_in_background()
+        return self._keys
+
+    def expires_in(self) -> float:
+        """
+        Seconds until the current keys have to be fetched again
+        :return:
+        """
+        return max(self._expires_at - time.monotonic(), 0.0)
+
+    async def aclose(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        if self._refreshing is not None:
+            self._refreshing.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+google_cert_cache = GoogleCertCache(
+    jwt_settings.JWT_GIT_CERTS_URL,
+    refresh_before=jwt_settings.JWT_GIT_CERTS_REFRESH_BEFORE,
+    min_refetch_interval=jwt_settings.JWT_GIT_CERTS_MIN_REFETCH,
+)
+
+
+class VerifiedTokenCache(ExpiringLRUCache):
+    """
+    Claims of verified Google ID tokens keyed by the SHA-256 digest of the raw
+    token. A client sends the same token until it expires, repeated requests
+    skip signature verification. Entries live until the token `exp` or the
+    expiry of the certs it was verified with, whichever comes first.
+    """
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token: str, now: Optional[float] = None) -> Optional[Mapping]:
+        """
+        Claims of an already verified token which has not expired yet
+        :param token:
+        :param now: unix timestamp, defaults to the current one
+        :return:
+        """
+        claims = super().get(self.key(token), now)
+        return None if claims is None else dict(claims)
+
+    def set(self, token: str, claims: Mapping, expires_at: float) -> None:
+        super().set(self.key(token), dict(claims), expires_at)
+
+
+google_token_cache = VerifiedTokenCache(jwt_settings.JWT_GIT_TOKEN_CACHE_SIZE)
+
+
+register_cache_metrics('google_id_token_cache', google_token_cache)
+
+
+def decode_google_id_token(token: Union[str, jws.ParsedToken], key) -> Mapping:
+    claims = jwt.decode(
+        token, key, algorithms=[ALGORITHMS.RS256], options=DECODE_OPTIONS, issuer=GOOGLE_ISSUERS,
+    )
+    if int(claims['iat']) > timegm(datetime.utcnow().utctimetuple()):
+        raise JWTError("Token used too early")
+    return claims
+
+
+async def verify_google_id_token(
+        token: str,
+        cert_cache: Optional[GoogleCertCache] = None,
+        token_cache: Optional[VerifiedTokenCache] = None,
+) -> Mapping:
+    """
+    Same checks as google.oauth2.id_token.verify_oauth2_token without blocking the event loop.
+    Certs come from the cache, the signature is verified by app.utils.jose in the threadpool.
+    Claims of verified tokens are reused until the token or its certs expire.
+    :param token: Google ID token
+    :param cert_cache:
+    :param token_cache:
+    :return: token claims
+    """
+    if cert_cache is None:
+        cert_cache = google_cert_cache
+    if token_cache is None:
+        token_cache = google_token_cache
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+    try:
+        # Split once, the key id lookup and the decode share it
+        parsed = jws.load(token)
+    except Exception:
+        raise GoogleAuthError("Error decoding token headers.")
+    kid = parsed.header.get('kid')
+    try:
+        keys = await cert_cache.get_keys(kid)
+    except JWKError as e:
+        raise TransportError(f"Invalid Google certificate: {e}")
+    if kid is not None:
+        if kid not in keys:
+            raise GoogleAuthError(f"Certificate for key id {kid} not found.")
+        key = keys[kid]
+    else:
+        key = list(keys.values())
+    try:
+        claims = await run_in_threadpool(decode_google_id_token, parsed, key)
+    except JWTError as e:
+        raise GoogleAuthError(str(e))
+    token_cache.set(token, claims, min(int(claims['exp']), time.time() + cert_cache.expires_in()))
+    return claims
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple, TypeVar
+
+from app.conf.config import settings
+from app.core.exceptions import PasswordHasherBusy
+from app.core.metrics import metrics
+
+from .security import lazy_jwt_settings, verify_dummy_password
+
+__all__ = ('PasswordHasher', 'password_hasher')
+
+T = TypeVar('T')
+
+hash_wait = metrics.histogram(
+    'password_hasher_seconds', 'Time from submitting a password hash or verify until its result', ('operation',)
+)
+
+
+class PasswordHasher:
+    """
+    Runs `JWT_PASSWORD_VERIFY` and `JWT_PASSWORD_HANDLER` (bcrypt) in a bounded
+    executor, so a login does not block the event loop for the whole hash.
+    At most `max_workers` hashes run at once and `max_pending` more may wait,
+    further calls fail fast with `PasswordHasherBusy` (served as 503).
+    """
+
+    def __init__(
+            self,
+            max_workers: Optional[int] = 4,
+            max_pending: Optional[int] = 64,
+            executor: Optional[str] = "thread",
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.executor_type = executor
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.executor_type == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.max_workers, thread_name_prefix='password-hasher'
+                        )
+        return self._executor
+
+    async def run(self, operation: str, func: Callable[..., T], *args) -> T:
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_pending:
+                raise PasswordHasherBusy("Too many password hashing requests")
+            self._in_flight += 1
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            hash_wait.observe(loop.time() - start, operation)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """
+        Check the password against its hash off the event loop
+        :param password:
+        :param hashed_password:
+        :return:
+        """
+        return await self.run('verify', lazy_jwt_settings.JWT_PASSWORD_VERIFY, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Check the password and rehash it when the hash does not match the hashing policy
+        :param password:
+        :param hashed_password:
+        :return: verified, new hash or None
+        """
+        return await self.run(
+            'verify', lazy_jwt_settings.JWT_PASSWORD_VERIFY_AND_UPDATE, password, hashed_password
+        )
+
+    async def verify_dummy(self, password: str) -> bool:
+        """
+        Spend the time of a verify for a login without a user
+        :param password:
+        :return: always False
+        """
+        return await self.run('verify', verify_dummy_password, password)
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash the password off the event loop
+        :param password:
+        :return:
+        """
+        return await self.run('hash', lazy_jwt_settings.JWT_PASSWORD_HANDLER, password)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASHER_WORKERS,
+    max_pending=settings.PASSWORD_HASHER_MAX_PENDING,
+    executor=settings.PASSWORD_HASHER_EXECUTOR,
+)
@@ -0,0 +1,108 @@
+import json
+import re
+from abc import ABC, abstractmethod
+from datetime import date, datetime, time
+from typing import Any, Callable, Optional, Union
+from uuid import UUID
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(obj: Any) -> Any:
+    """Serializes the claim values the stdlib json module does not know."""
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+
+
+class JSONCodec(ABC):
+    """Serializes JOSE headers and claims.
+
+    dumps() returns compact JSON bytes, with sorted keys when asked to, and
+    loads() parses bytes as well as str. Subclass it and pass an instance to
+    set_codec() to change the JSON library used by jws and jwt.
+    """
+
+    @abstractmethod
+    def dumps(self, obj: Any, sort_keys: bool = False) -> bytes:
+        pass
+
+    @abstractmethod
+    def loads(self, data: Union[str, bytes]) -> Any:
+        pass
+
+
+class StdlibJSONCodec(JSONCodec):
+    """The json module of the standard library, non-ASCII characters are escaped."""
+
+    def __init__(self, default: Optional[Callable[[Any], Any]] = default):
+        self.default = default
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), sort_keys=sort_keys, default=self.default).encode("utf-8")
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+# 19 digits in a row, integers outside of the 64 bit range have at least that many
+_long_number = re.compile(r"\d{19}")
+_long_number_bytes = re.compile(rb"\d{19}")
+
+
+class OrjsonCodec(JSONCodec):
+    """orjson, serializes UUID and datetime values natively.
+
+    The output matches StdlibJSONCodec for ASCII text. Non-ASCII characters
+    are written as UTF-8 instead of being escaped. Objects orjson refuses,
+    such as integers wider than 64 bits, are written by the stdlib json module
+    instead, and documents with numbers that may not fit in 64 bits are parsed
+    by it too, orjson would turn them into floats. `default` is called for
+    values neither of them knows.
+    """
+
+    def __init__(self, default: Optional[Callable[[Any], Any]] = None):
+        if orjson is None:
+            raise ImportError("OrjsonCodec requires orjson")
+        self.default = default
+        self.option = orjson.OPT_NON_STR_KEYS
+        self.sorted_option = self.option | orjson.OPT_SORT_KEYS
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> bytes:
+        try:
+            return orjson.dumps(obj, default=self.default, option=self.sorted_option if sort_keys else self.option)
+        except TypeError:
+            return json.dumps(
+                obj, separators=(",", ":"), sort_keys=sort_keys, ensure_ascii=False, default=self.default or default,
+            ).encode("utf-8")
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        pattern = _long_number_bytes if isinstance(data, bytes) else _long_number
+        if pattern.search(data) is not None:
+            return json.loads(data)
+        return orjson.loads(data)
+
+
+_codec: JSONCodec = OrjsonCodec() if orjson is not None else StdlibJSONCodec()
+
+
+def get_codec() -> JSONCodec:
+    return _codec
+
+
+def set_codec(codec: Optional[JSONCodec] = None) -> None:
+    """Replaces the JSON codec of jws and jwt.
+
+    Args:
+        codec (JSONCodec, optional): The codec to use, orjson when available or
+            the stdlib json module otherwise if omitted.
+    """
+    global _codec
+    if codec is None:
+        codec = OrjsonCodec() if orjson is not None else StdlibJSONCodec()
+    _codec = codec
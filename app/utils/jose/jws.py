@@ -1,15 +1,28 @@
 import binascii
 import json
 from collections.abc import Iterable, Mapping
-from typing import Union, Optional, List, Tuple
+from typing import Union, Optional, List, NamedTuple
 
-from . import jwk
+from . import codec, jwk
 from .backends.base import Key
 from .constants import ALGORITHMS
 from .exceptions import JWSError, JWSSignatureError
 from .utils import base64url_decode, base64url_encode
 
 
+class ParsedToken(NamedTuple):
+    """A compact JWS split and base64url decoded once.
+
+    Returned by load() and accepted by verify() and jwt.decode() in place of
+    the token string, so the token is not parsed again for every step.
+    """
+
+    header: Mapping
+    payload: bytes
+    signing_input: bytes
+    signature: bytes
+
+
 def sign(
         payload: Union[str, dict],
         key: Union[str, bytes, dict],
@@ -52,7 +65,7 @@ def sign(
 
 
 def verify(
-        token: str,
+        token: Union[str, bytes, ParsedToken],
         key: Union[str, dict],
         algorithms: Union[str, List[str]],
         verify_it: Optional[bool] = True
@@ -60,7 +73,8 @@ def verify(
     """Verifies a JWS string's signature.
 
     Args:
-        token (str): A signed JWS to be verified.
+        token (str or ParsedToken): A signed JWS to be verified, or the result of
+            load() for it.
         key (str or dict): A key to attempt to verify the payload with. Can be
             individual JWK or JWK set.
         algorithms (str or list): Valid algorithms that should be used to verify the JWS.
@@ -79,7 +93,7 @@ def verify(
 
     """
 
-    header, payload, signing_input, signature = _load(token)
+    header, payload, signing_input, signature = load(token)
 
     if verify_it:
         _verify_signature(signing_input, header, signature, key, algorithms)
@@ -87,6 +101,25 @@ def verify(
     return payload
 
 
+def load(token: Union[str, bytes, ParsedToken]) -> ParsedToken:
+    """Splits and decodes a JWS string without verification of any kind.
+
+    Args:
+        token (str or ParsedToken): A signed JWS, an already loaded one is
+            returned as is.
+
+    Returns:
+        ParsedToken: The decoded header, the payload bytes, the signing input
+            and the signature.
+
+    Raises:
+        JWSError: If there is an exception decoding the token.
+    """
+    if isinstance(token, ParsedToken):
+        return token
+    return _load(token)
+
+
 def get_unverified_header(token: str):
     """Returns the decoded headers without verification of any kind.
 
@@ -99,8 +132,7 @@ def get_unverified_header(token: str):
     Raises:
         JWSError: If there is an exception decoding the token.
     """
-    header, claims, signing_input, signature = _load(token)
-    return header
+    return load(token).header
 
 
 def get_unverified_headers(token: str):
@@ -133,8 +165,7 @@ def get_unverified_claims(token: str) -> bytes:
     Raises:
         JWSError: If there is an exception decoding the token.
     """
-    header, claims, signing_input, signature = _load(token)
-    return claims
+    return load(token).payload
 
 
 def _encode_header(algorithm: str, additional_headers: Optional[dict] = None) -> bytes:
@@ -143,11 +174,7 @@ def _encode_header(algorithm: str, additional_headers: Optional[dict] = None) ->
     if additional_headers:
         header.update(additional_headers)
 
-    json_header = json.dumps(
-        header,
-        separators=(",", ":"),
-        sort_keys=True,
-    ).encode("utf-8")
+    json_header = codec.get_codec().dumps(header, sort_keys=True)
 
     return base64url_encode(json_header)
 
@@ -155,12 +182,9 @@ def _encode_header(algorithm: str, additional_headers: Optional[dict] = None) ->
 def _encode_payload(payload: Union[str, dict]) -> bytes:
     if isinstance(payload, Mapping):
         try:
-            payload = json.dumps(
-                payload,
-                separators=(",", ":"),
-            ).encode("utf-8")
-        except ValueError:
-            pass
+            payload = codec.get_codec().dumps(payload)
+        except (TypeError, ValueError) as e:
+            raise JWSError("Invalid payload: %s" % e)
 
     return base64url_encode(payload)
 
@@ -181,7 +205,7 @@ def _sign_header_and_claims(encoded_header: bytes, encoded_claims, algorithm: st
     return encoded_string.decode("utf-8")
 
 
-def _load(jwt: str) -> Tuple[Mapping, bytes, List[bytes], bytes]:
+def _load(jwt: Union[str, bytes]) -> ParsedToken:
     if isinstance(jwt, str):
         jwt = jwt.encode("utf-8")
     try:
@@ -194,7 +218,7 @@ def _load(jwt: str) -> Tuple[Mapping, bytes, List[bytes], bytes]:
         raise JWSError("Invalid header padding")
 
     try:
-        header = json.loads(header_data.decode("utf-8"))
+        header = codec.get_codec().loads(header_data)
     except ValueError as e:
         raise JWSError("Invalid header string: %s" % e)
 
@@ -211,7 +235,7 @@ def _load(jwt: str) -> Tuple[Mapping, bytes, List[bytes], bytes]:
     except (TypeError, binascii.Error):
         raise JWSError("Invalid crypto padding")
 
-    return header, payload, signing_input, signature
+    return ParsedToken(header, payload, signing_input, signature)
 
 
 def _sig_matches_keys(keys, signing_input, signature, alg):
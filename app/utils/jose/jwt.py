@@ -1,16 +1,39 @@
-import json
 from calendar import timegm
 from collections.abc import Mapping
+from concurrent.futures import Executor
 from datetime import datetime, timedelta
-from typing import Union, Optional, List
+from typing import Callable, Iterable, Union, Optional, List
 
-from . import jws
+from . import codec, jwk, jws
+from .backends.base import Key
 
 from .constants import ALGORITHMS
-from .exceptions import ExpiredSignatureError, JWSError, JWTClaimsError, JWTError
+from .exceptions import ExpiredSignatureError, JWKError, JWSError, JWTClaimsError, JWTError
 from .utils import calculate_at_hash, timedelta_total_seconds
 
 
+DEFAULT_OPTIONS = {
+    "verify_signature": True,
+    "verify_aud": True,
+    "verify_iat": True,
+    "verify_exp": True,
+    "verify_nbf": True,
+    "verify_iss": True,
+    "verify_sub": True,
+    "verify_jti": True,
+    "verify_at_hash": True,
+    "require_aud": False,
+    "require_iat": False,
+    "require_exp": False,
+    "require_nbf": False,
+    "require_iss": False,
+    "require_sub": False,
+    "require_jti": False,
+    "require_at_hash": False,
+    "leeway": 0,
+}
+
+
 def encode(
         claims: dict,
         key: Union[str, dict],
@@ -61,19 +84,21 @@ def encode(
 
 
 def decode(
-        token: str,
+        token: Union[str, bytes, jws.ParsedToken],
         key: Union[str, dict],
         algorithms: Optional[Union[str, List[str]]] = None,
         options: Optional[dict] = None,
         audience: Optional[str] = None,
         issuer: Optional[str] = None,
         subject: Optional[str] = None,
-        access_token: Optional[str] = None
+        access_token: Optional[str] = None,
+        validator: Optional["ClaimValidator"] = None,
 ):
     """Verifies a JWT string's signature and validates reserved claims.
 
     Args:
-        token (str): A signed JWS to be verified.
+        token (str or ParsedToken): A signed JWS to be verified, or the result of
+            jws.load() for it. The token is split and decoded only once.
         key (str or dict): A key to attempt to verify the payload with. Can be
             individual JWK or JWK set.
         algorithms (str or list): Valid algorithms that should be used to verify the JWS.
@@ -111,6 +136,8 @@ def decode(
                 'require_at_hash': False,
                 'leeway': 0,
             }
+        validator (ClaimValidator): Claim checks compiled once for repeated decodes.
+            When given, options, audience, issuer and subject are taken from it.
 
     Returns:
         dict: The dict representation of the claims set, assuming the signature is valid
@@ -128,57 +155,103 @@ def decode(
 
     """
 
-    defaults = {
-        "verify_signature": True,
-        "verify_aud": True,
-        "verify_iat": True,
-        "verify_exp": True,
-        "verify_nbf": True,
-        "verify_iss": True,
-        "verify_sub": True,
-        "verify_jti": True,
-        "verify_at_hash": True,
-        "require_aud": False,
-        "require_iat": False,
-        "require_exp": False,
-        "require_nbf": False,
-        "require_iss": False,
-        "require_sub": False,
-        "require_jti": False,
-        "require_at_hash": False,
-        "leeway": 0,
-    }
-
-    if options:
-        defaults.update(options)
-
-    verify_signature = defaults.get("verify_signature", True)
+    if validator is None:
+        validator = ClaimValidator(options, audience=audience, issuer=issuer, subject=subject)
+
+    return _decode(token, key, algorithms, validator, access_token=access_token)
+
+
+def decode_many(
+        tokens: Iterable[Union[str, bytes, jws.ParsedToken]],
+        key: Union[str, dict],
+        algorithms: Optional[Union[str, List[str]]] = None,
+        options: Optional[dict] = None,
+        audience: Optional[str] = None,
+        issuer: Optional[str] = None,
+        subject: Optional[str] = None,
+        validator: Optional["ClaimValidator"] = None,
+        executor: Optional[Executor] = None,
+) -> List[Union[Mapping, JWTError]]:
+    """Verifies a batch of JWT strings signed with the same key.
+
+    Every token gets the checks of decode(). The key is constructed once,
+    the claim validator is compiled once and the clock is read once for the
+    whole batch. A failing token does not stop the others.
+
+    Args:
+        tokens (iterable): Signed JWS strings to be verified.
+        key (str or dict): Same as the key of decode().
+        algorithms (str or list): Valid algorithms that should be used to verify the JWS.
+        options (dict): Same as the options of decode().
+        audience (str): The intended audience of the tokens.
+        issuer (str or iterable): Acceptable value(s) for the issuer of the tokens.
+        subject (str): The subject of the tokens.
+        validator (ClaimValidator): Claim checks compiled once, replaces options,
+            audience, issuer and subject.
+        executor (Executor): Verifies the tokens in parallel when given. Worth it
+            for RSA and EC signatures, OpenSSL releases the GIL while verifying.
+
+    Returns:
+        list: The claims dict of every valid token and the JWTError raised for
+            every invalid one, in the order of the tokens.
+
+    Raises:
+        JWTError: If the audience is not a string or None.
+    """
+    if validator is None:
+        validator = ClaimValidator(options, audience=audience, issuer=issuer, subject=subject)
+    key = _construct_key(key, algorithms)
+    now = _now()
+
+    def decode_one(token):
+        try:
+            return _decode(token, key, algorithms, validator, now=now)
+        except JWTError as e:
+            return e
+
+    if executor is None:
+        return [decode_one(token) for token in tokens]
+    return list(executor.map(decode_one, tokens))
+
+
+def _construct_key(key, algorithms):
+    """A single key of a single algorithm as a Key object, anything else as is."""
+    if isinstance(key, Key):
+        return key
+    if isinstance(algorithms, str):
+        algorithms = [algorithms]
+    if not algorithms or len(algorithms) != 1:
+        return key
+    keys = list(jws._get_keys(key))
+    if len(keys) != 1:
+        return key
+    try:
+        return jwk.construct(keys[0], algorithms[0])
+    except JWKError:
+        return key
+
+
+def _decode(token, key, algorithms, validator: "ClaimValidator", access_token=None, now=None):
+    verify_signature = validator.options.get("verify_signature", True)
 
     try:
+        token = jws.load(token)
         payload = jws.verify(token, key, algorithms, verify_it=verify_signature)
     except JWSError as e:
         raise JWTError(e)
 
     # Needed for at_hash verification
-    algorithm = jws.get_unverified_header(token)["alg"]
+    algorithm = token.header["alg"]
 
     try:
-        claims = json.loads(payload.decode("utf-8"))
+        claims = codec.get_codec().loads(payload)
     except ValueError as e:
         raise JWTError("Invalid payload string: %s" % e)
 
     if not isinstance(claims, Mapping):
         raise JWTError("Invalid payload string: must be a json object")
 
-    _validate_claims(
-        claims,
-        audience=audience,
-        issuer=issuer,
-        subject=subject,
-        algorithm=algorithm,
-        access_token=access_token,
-        options=defaults,
-    )
+    validator.validate(claims, algorithm=algorithm, access_token=access_token, now=now)
 
     return claims
 
@@ -239,7 +312,7 @@ def get_unverified_claims(token: str) -> Mapping:
         raise JWTError("Error decoding token claims.")
 
     try:
-        claims = json.loads(claims.decode("utf-8"))
+        claims = codec.get_codec().loads(claims)
     except ValueError as e:
         raise JWTError("Invalid claims string: %s" % e)
 
@@ -270,7 +343,7 @@ def _validate_iat(claims: Mapping):
         raise JWTClaimsError("Issued At claim (iat) must be an integer.")
 
 
-def _validate_nbf(claims: Mapping, leeway: Optional[int] = 0):
+def _validate_nbf(claims: Mapping, leeway: Optional[int] = 0, now: Optional[int] = None):
     """Validates that the 'nbf' claim is valid.
 
     The "nbf" (not before) claim identifies the time before which the JWT
@@ -284,6 +357,7 @@ def _validate_nbf(claims: Mapping, leeway: Optional[int] = 0):
     Args:
         claims (dict): The claims dictionary to validate.
         leeway (int): The number of seconds of skew that is allowed.
+        now (int): The current unix time, read from the clock when omitted.
     """
 
     if "nbf" not in claims:
@@ -294,13 +368,14 @@ def _validate_nbf(claims: Mapping, leeway: Optional[int] = 0):
     except ValueError:
         raise JWTClaimsError("Not Before claim (nbf) must be an integer.")
 
-    now = timegm(datetime.utcnow().utctimetuple())
+    if now is None:
+        now = _now()
 
     if nbf > (now + leeway):
         raise JWTClaimsError("The token is not yet valid (nbf)")
 
 
-def _validate_exp(claims: Mapping, leeway: Optional[int] = 0):
+def _validate_exp(claims: Mapping, leeway: Optional[int] = 0, now: Optional[int] = None):
     """Validates that the 'exp' claim is valid.
 
     The "exp" (expiration time) claim identifies the expiration time on
@@ -314,6 +389,7 @@ def _validate_exp(claims: Mapping, leeway: Optional[int] = 0):
     Args:
         claims (dict): The claims dictionary to validate.
         leeway (int): The number of seconds of skew that is allowed.
+        now (int): The current unix time, read from the clock when omitted.
     """
 
     if "exp" not in claims:
@@ -324,7 +400,8 @@ def _validate_exp(claims: Mapping, leeway: Optional[int] = 0):
     except ValueError:
         raise JWTClaimsError("Expiration Time claim (exp) must be an integer.")
 
-    now = timegm(datetime.utcnow().utctimetuple())
+    if now is None:
+        now = _now()
 
     if exp < (now - leeway):
         raise ExpiredSignatureError("Signature has expired.")
@@ -471,6 +548,115 @@ def _validate_at_hash(claims: Mapping, access_token: str, algorithm: str):
         raise JWTClaimsError("at_hash claim does not match access_token.")
 
 
+def _now() -> int:
+    return timegm(datetime.utcnow().utctimetuple())
+
+
+class ClaimValidator:
+    """Reserved claim checks of decode() compiled once.
+
+    Options are merged with the defaults, the required claims and the enabled
+    checks are resolved when the validator is built. validate() only runs the
+    precomputed checks and reads the clock at most once, so a validator built
+    for a fixed set of options can be reused for every token.
+
+    Args:
+        options (dict): Same as the options of decode().
+        audience (str): The intended audience of the token.
+        issuer (str or iterable): Acceptable value(s) for the issuer of the token.
+        subject (str): The subject of the token.
+        leeway (int or timedelta): Overrides the "leeway" option.
+
+    Raises:
+        JWTError: If the audience is not a string or None.
+    """
+
+    __slots__ = ("options", "audience", "issuer", "subject", "leeway", "required", "checks", "uses_clock")
+
+    def __init__(
+            self,
+            options: Optional[dict] = None,
+            audience: Optional[str] = None,
+            issuer: Optional[Union[str, Iterable[str]]] = None,
+            subject: Optional[str] = None,
+            leeway: Optional[Union[int, timedelta]] = None,
+    ):
+        if not isinstance(audience, (str, type(None))):
+            raise JWTError("audience must be a string or None")
+
+        options = dict(DEFAULT_OPTIONS, **(options or {}))
+        if leeway is None:
+            leeway = options.get("leeway", 0)
+        if isinstance(leeway, timedelta):
+            leeway = timedelta_total_seconds(leeway)
+        if isinstance(issuer, str):
+            issuer = (issuer,)
+
+        required = tuple(e[len("require_"):] for e in options.keys() if e.startswith("require_") and options[e])
+        for require_claim in required:
+            options["verify_" + require_claim] = True  # override verify when required
+
+        checks: List[Callable[[Mapping, Optional[int], Optional[str], Optional[str]], None]] = []
+        if options.get("verify_iat"):
+            checks.append(lambda claims, now, algorithm, access_token: _validate_iat(claims))
+        if options.get("verify_nbf"):
+            checks.append(lambda claims, now, algorithm, access_token: _validate_nbf(claims, leeway, now))
+        if options.get("verify_exp"):
+            checks.append(lambda claims, now, algorithm, access_token: _validate_exp(claims, leeway, now))
+        if options.get("verify_aud"):
+            checks.append(lambda claims, now, algorithm, access_token: _validate_aud(claims, audience))
+        if options.get("verify_iss"):
+            checks.append(lambda claims, now, algorithm, access_token: _validate_iss(claims, issuer))
+        if options.get("verify_sub"):
+            checks.append(lambda claims, now, algorithm, access_token: _validate_sub(claims, subject))
+        if options.get("verify_jti"):
+            checks.append(lambda claims, now, algorithm, access_token: _validate_jti(claims))
+        if options.get("verify_at_hash"):
+            checks.append(
+                lambda claims, now, algorithm, access_token: _validate_at_hash(claims, access_token, algorithm)
+            )
+
+        self.options = options
+        self.audience = audience
+        self.issuer = issuer
+        self.subject = subject
+        self.leeway = leeway
+        self.required = required
+        self.checks = tuple(checks)
+        self.uses_clock = bool(options.get("verify_nbf") or options.get("verify_exp"))
+
+    def validate(
+            self,
+            claims: Mapping,
+            algorithm: Optional[str] = None,
+            access_token: Optional[str] = None,
+            now: Optional[int] = None,
+    ) -> None:
+        """Validates the reserved claims of a decoded claims set.
+
+        Args:
+            claims (dict): The claims dictionary to validate.
+            algorithm (str): The algorithm of the token header, needed for at_hash.
+            access_token (str): An access token to compare against the at_hash claim.
+            now (int): The current unix time, read from the clock once when omitted.
+                Pass the same value to share one clock read across many tokens.
+
+        Raises:
+            ExpiredSignatureError: If the signature has expired.
+            JWTClaimsError: If any claim is invalid in any way.
+            JWTError: If a required claim is missing.
+        """
+        for require_claim in self.required:
+            if require_claim not in claims:
+                raise JWTError('missing required key "%s" among claims' % require_claim)
+
+        if now is None and self.uses_clock:
+            now = _now()
+
+        for check in self.checks:
+            check(claims, now, algorithm, access_token)
+
+
 def _validate_claims(
         claims: Mapping,
         audience: Optional[str] = None,
@@ -482,40 +668,6 @@ def _validate_claims(
 ) -> None:
     if options is None:
         return
-    leeway = options.get("leeway", 0)
-
-    if isinstance(leeway, timedelta):
-        leeway = timedelta_total_seconds(leeway)
-    required_claims = [e[len("require_"):] for e in options.keys() if e.startswith("require_") and options[e]]
-    for require_claim in required_claims:
-        if require_claim not in claims:
-            raise JWTError('missing required key "%s" among claims' % require_claim)
-        else:
-            options["verify_" + require_claim] = True  # override verify when required
-
-    if not isinstance(audience, ((str,), type(None))):
-        raise JWTError("audience must be a string or None")
-
-    if options.get("verify_iat"):
-        _validate_iat(claims)
-
-    if options.get("verify_nbf"):
-        _validate_nbf(claims, leeway=leeway)
-
-    if options.get("verify_exp"):
-        _validate_exp(claims, leeway=leeway)
-
-    if options.get("verify_aud"):
-        _validate_aud(claims, audience=audience)
-
-    if options.get("verify_iss"):
-        _validate_iss(claims, issuer=issuer)
-
-    if options.get("verify_sub"):
-        _validate_sub(claims, subject=subject)
-
-    if options.get("verify_jti"):
-        _validate_jti(claims)
-
-    if options.get("verify_at_hash"):
-        _validate_at_hash(claims, access_token, algorithm)
+    ClaimValidator(options, audience=audience, issuer=issuer, subject=subject).validate(
+        claims, algorithm=algorithm, access_token=access_token,
+    )
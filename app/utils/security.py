@@ -1,8 +1,12 @@
 import os
 import json
 
-from app.utils.jose import jwt
+from app.utils.jose import codec as jose_codec, jwk, jwt
+from app.utils.jose.backends.base import Key
+from app.utils.jose.exceptions import JWKError, JWTError
+from app.utils.jose.jwt import ClaimValidator
 from calendar import timegm
+from concurrent.futures import ThreadPoolExecutor
 
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
@@ -10,34 +14,51 @@ from fastapi.encoders import jsonable_encoder
 
 from datetime import datetime, timedelta
 from fastapi.security import OAuth2
-from typing import Optional, Dict
+from typing import Callable, List, Optional, Dict, Tuple, Union
 from fastapi.openapi.models import OAuthFlows as OAuthFlowsModel
 from starlette.requests import Request
 from starlette.status import HTTP_401_UNAUTHORIZED
 from fastapi.exceptions import HTTPException
-from fastapi.security.utils import get_authorization_scheme_param
 
 from passlib.context import CryptContext
+from passlib.hash import argon2
 
 from app.conf.config import jwt_settings, structure_settings
+from app.core.cache import ExpiringLRUCache, register_cache_metrics
+from app.core.exceptions import ImproperlyConfigured
 
 from .import_utils import perform_import
 
-__all__ = ('jwt_payload', 'jwt_encode', 'jwt_decode', 'verify_password', 'get_password_hash',
-           'generate_rsa_certificate', 'lazy_jwt_settings', 'OAuth2PasswordBearerWithCookie')
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+__all__ = ('jwt_payload', 'jwt_encode', 'jwt_decode', 'jwt_decode_many', 'get_jwt_executor', 'shutdown_jwt_executor',
+           'install_jwt_codec',
+           'verify_password', 'get_password_hash',
+           'verify_and_update_password', 'verify_dummy_password', 'build_password_context', 'JWTKeys', 'get_jwt_keys',
+           'get_claim_validator', 'generate_rsa_certificate', 'lazy_jwt_settings', 'OAuth2PasswordBearerWithCookie',
+           'RequestCredentials', 'get_request_credentials', 'token_payload_cache')
 
 IMPORT_STRINGS = (
     'JWT_PASSWORD_VERIFY',
     'JWT_PASSWORD_HANDLER',
+    'JWT_PASSWORD_VERIFY_AND_UPDATE',
     'JWT_ENCODE_HANDLER',
     'JWT_DECODE_HANDLER',
+    'JWT_DECODE_MANY_HANDLER',
     'JWT_PAYLOAD_HANDLER',
     'JWT_ALLOW_ANY_HANDLER',
     'JWT_ALLOW_ANY_CLASSES',
 )
 
+def install_jwt_codec() -> None:
+    """
+    Encode claim values the jose codec does not know (Decimal, pydantic models, ...) like responses,
+    replaces the codec of every jose user in the process, called on application startup
+    :return:
+    """
+    if jose_codec.orjson is not None:
+        jose_codec.set_codec(jose_codec.OrjsonCodec(default=jsonable_encoder))
+    else:
+        jose_codec.set_codec(jose_codec.StdlibJSONCodec(default=jsonable_encoder))
+
 
 def jwt_payload(data: dict, expires_delta: Optional[timedelta] = None) -> dict:
     iat = datetime.utcnow()
@@ -56,43 +77,230 @@ def jwt_payload(data: dict, expires_delta: Optional[timedelta] = None) -> dict:
     return payload
 
 
+class JWTKeys:
+    """
+    Signing and verification keys of `JWT_ALGORITHM` parsed once into key objects,
+    so PEM keys are not loaded again for every token. Key material the backend
+    cannot construct is kept as is and fails the way it did when signing.
+    """
+    __slots__ = ('algorithm', 'signing_key', 'verifying_key')
+
+    def __init__(
+            self,
+            algorithm: str,
+            private_key: Optional[str] = None,
+            public_key: Optional[str] = None,
+            secret_key: Optional[str] = None,
+    ):
+        self.algorithm = algorithm
+        self.signing_key = self.construct(private_key or secret_key, algorithm)
+        self.verifying_key = self.construct(public_key or secret_key, algorithm)
+
+    @staticmethod
+    def construct(key_data: Optional[str], algorithm: str) -> Union[Key, str, None]:
+        if not key_data:
+            return key_data
+        try:
+            return jwk.construct(key_data, algorithm)
+        except JWKError:
+            return key_data
+
+
+_jwt_keys: Optional[JWTKeys] = None
+
+
+def get_jwt_keys() -> JWTKeys:
+    """
+    Keys of the current settings, built on first use and again after `lazy_jwt_settings.reload()`
+    :return:
+    """
+    global _jwt_keys
+    if _jwt_keys is None:
+        _jwt_keys = JWTKeys(
+            lazy_jwt_settings.JWT_ALGORITHM,
+            private_key=lazy_jwt_settings.JWT_PRIVATE_KEY,
+            public_key=lazy_jwt_settings.JWT_PUBLIC_KEY,
+            secret_key=lazy_jwt_settings.JWT_SECRET_KEY,
+        )
+    return _jwt_keys
+
+
 def jwt_encode(payload) -> str:
+    keys = get_jwt_keys()
     return jwt.encode(
-        jsonable_encoder(payload),
-        jwt_settings.JWT_PRIVATE_KEY or jwt_settings.JWT_SECRET_KEY,
-        jwt_settings.JWT_ALGORITHM,
+        dict(payload),
+        keys.signing_key,
+        keys.algorithm,
     )
 
 
+_claim_validators: Dict[Tuple[Optional[str], Optional[str]], ClaimValidator] = {}
+
+
+def get_claim_validator(issuer: Optional[str] = None, audience: Optional[str] = None) -> ClaimValidator:
+    """
+    Claim checks of `jwt_decode` compiled once per issuer and audience, built again after
+    `lazy_jwt_settings.reload()`
+    :param issuer:
+    :param audience:
+    :return:
+    """
+    validator = _claim_validators.get((issuer, audience))
+    if validator is None:
+        validator = _claim_validators[(issuer, audience)] = ClaimValidator(
+            options={
+                'verify_signature': lazy_jwt_settings.JWT_VERIFY,
+                'verify_exp': lazy_jwt_settings.JWT_VERIFY_EXPIRATION,
+                "verify_jti": True,
+                'require_exp': True,
+                "require_jti": True,
+            },
+            audience=audience,
+            issuer=issuer,
+            leeway=lazy_jwt_settings.JWT_LEEWAY,
+        )
+    return validator
+
+
 def jwt_decode(
         token, issuer: Optional[str] = jwt_settings.JWT_ISSUER,
         audience: Optional[str] = None,
 ) -> dict:
+    keys = get_jwt_keys()
     return jwt.decode(
         token=token,
-        key=jwt_settings.JWT_PUBLIC_KEY or jwt_settings.JWT_SECRET_KEY,
-        algorithms=[jwt_settings.JWT_ALGORITHM],
-        options={
-            'verify_signature': jwt_settings.JWT_VERIFY,
-            'verify_exp': jwt_settings.JWT_VERIFY_EXPIRATION,
-            "verify_jti": True,
-            'leeway': jwt_settings.JWT_LEEWAY,
-            'require_exp': True,
-            "require_jti": True,
-        },
-        audience=audience,
-        issuer=issuer,
+        key=keys.verifying_key,
+        algorithms=[keys.algorithm],
+        validator=get_claim_validator(issuer, audience),
+    )
+
+
+_jwt_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_jwt_executor() -> Optional[ThreadPoolExecutor]:
+    """
+    Threads verifying batches of RSA/EC signed tokens, None when `JWT_VERIFY_BATCH_WORKERS` is 0
+    :return:
+    """
+    global _jwt_executor
+    if _jwt_executor is None and lazy_jwt_settings.JWT_VERIFY_BATCH_WORKERS:
+        _jwt_executor = ThreadPoolExecutor(
+            max_workers=lazy_jwt_settings.JWT_VERIFY_BATCH_WORKERS, thread_name_prefix='jwt-verify',
+        )
+    return _jwt_executor
+
+
+def shutdown_jwt_executor(wait: bool = False) -> None:
+    global _jwt_executor
+    executor, _jwt_executor = _jwt_executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def jwt_decode_many(
+        tokens: List[str], issuer: Optional[str] = jwt_settings.JWT_ISSUER,
+        audience: Optional[str] = None,
+) -> List[Union[dict, JWTError]]:
+    """
+    `jwt_decode` of a batch of tokens sharing the keys, the claim validator and one clock read
+    :param tokens:
+    :param issuer:
+    :param audience:
+    :return: claims of every valid token, the error of every invalid one
+    """
+    keys = get_jwt_keys()
+    executor = None
+    # HMAC is too cheap to gain from threads
+    if len(tokens) > 1 and not keys.algorithm.startswith('HS'):
+        executor = get_jwt_executor()
+    return jwt.decode_many(
+        tokens,
+        key=keys.verifying_key,
+        algorithms=[keys.algorithm],
+        validator=get_claim_validator(issuer, audience),
+        executor=executor,
     )
 
 
+def build_password_context(
+        schemes: List[str],
+        bcrypt_rounds: Optional[int] = None,
+        argon2_time_cost: Optional[int] = None,
+        argon2_memory_cost: Optional[int] = None,
+) -> CryptContext:
+    """
+    Passlib context of the hashing policy, hashes not matching the first scheme
+    and its costs are reported as needing an update
+    :param schemes:
+    :param bcrypt_rounds:
+    :param argon2_time_cost:
+    :param argon2_memory_cost:
+    :return:
+    """
+    if 'argon2' in schemes and not argon2.has_backend():
+        raise ImproperlyConfigured("argon2 password hashing requires the argon2-cffi package")
+    options = {}
+    if bcrypt_rounds:
+        options['bcrypt__rounds'] = bcrypt_rounds
+    if 'argon2' in schemes:
+        if argon2_time_cost:
+            options['argon2__time_cost'] = argon2_time_cost
+        if argon2_memory_cost:
+            options['argon2__memory_cost'] = argon2_memory_cost
+    return CryptContext(schemes=schemes, deprecated="auto", **options)
+
+
+pwd_context = build_password_context(
+    jwt_settings.JWT_PASSWORD_SCHEMES,
+    bcrypt_rounds=jwt_settings.JWT_PASSWORD_BCRYPT_ROUNDS,
+    argon2_time_cost=jwt_settings.JWT_PASSWORD_ARGON2_TIME_COST,
+    argon2_memory_cost=jwt_settings.JWT_PASSWORD_ARGON2_MEMORY_COST,
+)
+
+
+def make_dummy_hash(context: CryptContext) -> str:
+    """
+    Hash of a random password under the policy of the context
+    :param context:
+    :return:
+    """
+    return context.hash(os.urandom(16).hex())
+
+
+# Built with the context, so the first unknown email does not pay for hashing it
+_dummy_hash = make_dummy_hash(pwd_context)
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify the password and rehash it when its hash does not match the current policy
+    :param plain_password:
+    :param hashed_password:
+    :return: verified, new hash or None
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def verify_dummy_password(plain_password: str) -> bool:
+    """
+    Verify against a random hash of the current policy, logins of unknown users
+    take as long as the ones with a wrong password
+    :param plain_password:
+    :return: always False
+    """
+    pwd_context.verify(plain_password, _dummy_hash)
+    return False
+
+
 def generate_rsa_certificate():
     private_key = rsa.generate_private_key(
         public_exponent=65537,
@@ -131,6 +339,7 @@ class JWTSettings:
         self.defaults = defaults
         self.import_strings = import_strings
         self._cached_attrs = set()
+        self._reload_callbacks: List[Callable[[], None]] = []
 
     def __getattr__(self, attr):
         if attr not in self.defaults:
@@ -158,9 +367,108 @@ class JWTSettings:
         if hasattr(self, '_user_settings'):
             delattr(self, '_user_settings')
 
+        for callback in self._reload_callbacks:
+            callback()
+
+    def on_reload(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Register a callable to run after `reload`, e.g. to drop state derived from rotated keys
+        :param callback:
+        :return:
+        """
+        self._reload_callbacks.append(callback)
+        return callback
+
 
 lazy_jwt_settings = JWTSettings(jwt_settings.model_dump(), IMPORT_STRINGS)
 
+# Validated access token payloads keyed by the raw token, used by `get_token_payload`
+token_payload_cache = ExpiringLRUCache(jwt_settings.JWT_TOKEN_CACHE_SIZE)
+register_cache_metrics('access_token_cache', token_payload_cache)
+
+
+@lazy_jwt_settings.on_reload
+def reset_password_context() -> None:
+    global pwd_context, _dummy_hash
+    context = build_password_context(
+        lazy_jwt_settings.JWT_PASSWORD_SCHEMES,
+        bcrypt_rounds=lazy_jwt_settings.JWT_PASSWORD_BCRYPT_ROUNDS,
+        argon2_time_cost=lazy_jwt_settings.JWT_PASSWORD_ARGON2_TIME_COST,
+        argon2_memory_cost=lazy_jwt_settings.JWT_PASSWORD_ARGON2_MEMORY_COST,
+    )
+    _dummy_hash = make_dummy_hash(context)
+    pwd_context = context
+
+
+@lazy_jwt_settings.on_reload
+def reset_jwt_keys() -> None:
+    global _jwt_keys
+    _jwt_keys = None
+
+
+@lazy_jwt_settings.on_reload
+def reset_claim_validators() -> None:
+    _claim_validators.clear()
+
+
+@lazy_jwt_settings.on_reload
+def reset_jwt_executor() -> None:
+    shutdown_jwt_executor()
+
+
+@lazy_jwt_settings.on_reload
+def reset_token_payload_cache() -> None:
+    # Tokens verified with the previous keys must be verified again
+    token_payload_cache.max_size = lazy_jwt_settings.JWT_TOKEN_CACHE_SIZE
+    token_payload_cache.clear()
+
+
+def bearer_param(header: Optional[str], cookie: Optional[str]) -> Optional[str]:
+    """
+    Token of the first "Bearer <token>" value, header wins over cookie
+    :param header:
+    :param cookie:
+    :return:
+    """
+    for value in (header, cookie):
+        if value:
+            scheme, _, param = value.partition(" ")
+            if scheme.lower() == "bearer":
+                return param
+    return None
+
+
+class RequestCredentials:
+    """
+    Access token and Google ID token of a request, parsed once from headers and cookies
+    """
+    __slots__ = ('access_token', 'id_token')
+
+    def __init__(self, access_token: Optional[str], id_token: Optional[str]):
+        self.access_token = access_token
+        self.id_token = id_token
+
+
+def get_request_credentials(request: Request) -> RequestCredentials:
+    """
+    Credentials of the request, memoized on `request.state` for all dependencies
+    :param request:
+    :return:
+    """
+    credentials = getattr(request.state, 'credentials', None)
+    if credentials is None:
+        headers = request.headers
+        cookies = request.cookies
+        credentials = request.state.credentials = RequestCredentials(
+            access_token=bearer_param(
+                headers.get(jwt_settings.JWT_AUTH_HEADER_NAME), cookies.get(jwt_settings.JWT_AUTH_COOKIE_NAME)
+            ),
+            id_token=bearer_param(
+                headers.get(lazy_jwt_settings.JWT_GIT_HEADER_NAME), cookies.get(lazy_jwt_settings.JWT_GIT_COOKIE_NAME)
+            ),
+        )
+    return credentials
+
 
 class OAuth2PasswordBearerWithCookie(OAuth2):
     def __hash__(self):
@@ -185,24 +493,8 @@ class OAuth2PasswordBearerWithCookie(OAuth2):
         )
 
     async def __call__(self, request: Request) -> Optional[str]:
-        header_authorization: str = request.headers.get(jwt_settings.JWT_AUTH_HEADER_NAME)
-        cookie_authorization: str = request.cookies.get(jwt_settings.JWT_AUTH_COOKIE_NAME)
-        header_scheme, header_param = get_authorization_scheme_param(header_authorization)
-        cookie_scheme, cookie_param = get_authorization_scheme_param(cookie_authorization)
-        if header_scheme.lower() == "bearer":
-            authorization = True
-            scheme = header_scheme
-            param = header_param
-        elif cookie_scheme.lower() == "bearer":
-            authorization = True
-            scheme = cookie_scheme
-            param = cookie_param
-        else:
-            authorization = False
-            scheme = ''
-            param = None
-
-        if not authorization or scheme.lower() != "bearer":
+        param = get_request_credentials(request).access_token
+        if param is None:
             if self.auto_error:
                 raise HTTPException(
                     status_code=HTTP_401_UNAUTHORIZED,
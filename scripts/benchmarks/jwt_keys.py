@@ -0,0 +1,70 @@
+"""
+Tokens per second of jwt.encode / jwt.decode with raw key material (PEM parsed
+for every token, old behaviour) versus key objects built once by `JWTKeys`.
+
+    python -m scripts.benchmarks.jwt_keys --tokens 2000
+"""
+import argparse
+import time
+from typing import Callable, Tuple
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from app.utils.jose import jwt
+from app.utils.security import JWTKeys
+
+CLAIMS = {"user_id": 1, "aud": "client", "iss": "backend", "exp": 4102444800}
+
+
+def pem_pair(private_key) -> Tuple[str, str]:
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode("utf-8")
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode("utf-8")
+    return private_pem, public_pem
+
+
+def rate(func: Callable[[], object], tokens: int) -> float:
+    start = time.perf_counter()
+    for _ in range(tokens):
+        func()
+    return tokens / (time.perf_counter() - start)
+
+
+def main(tokens: int) -> None:
+    key_material = {
+        "HS256": ("secret-" * 8, "secret-" * 8),
+        "RS256": pem_pair(rsa.generate_private_key(public_exponent=65537, key_size=2048)),
+        "ES256": pem_pair(ec.generate_private_key(ec.SECP256R1())),
+    }
+    for algorithm, (signing, verifying) in key_material.items():
+        keys = JWTKeys(algorithm, private_key=signing, public_key=verifying)
+        token = jwt.encode(CLAIMS, signing, algorithm)
+        for operation, raw, prebuilt in (
+                (
+                    "encode",
+                    lambda: jwt.encode(CLAIMS, signing, algorithm),
+                    lambda: jwt.encode(CLAIMS, keys.signing_key, algorithm),
+                ),
+                (
+                    "decode",
+                    lambda: jwt.decode(token, verifying, [algorithm], audience="client"),
+                    lambda: jwt.decode(token, keys.verifying_key, [algorithm], audience="client"),
+                ),
+        ):
+            raw_rate = rate(raw, tokens)
+            prebuilt_rate = rate(prebuilt, tokens)
+            print(
+                f"{algorithm} {operation}: raw key {raw_rate:9.0f} tokens/s, "
+                f"key object {prebuilt_rate:9.0f} tokens/s ({prebuilt_rate / raw_rate:5.2f}x)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.tokens)
@@ -0,0 +1,81 @@
+"""
+Latency of a cheap endpoint while logins are hammered, bcrypt verified inline on
+the event loop (old behaviour) versus offloaded to the `PasswordHasher` pool.
+
+    python -m scripts.benchmarks.login_latency --logins 8 --duration 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+from app.core.exceptions import PasswordHasherBusy
+from app.core.handlers import password_hasher_busy_exception
+from app.utils.hashing import PasswordHasher
+from app.utils.security import get_password_hash, verify_password
+
+
+def get_app(hasher: PasswordHasher, hashed_password: str, offload: bool) -> FastAPI:
+    app = FastAPI(exception_handlers={PasswordHasherBusy: password_hasher_busy_exception})
+
+    @app.post("/login")
+    async def login() -> bool:
+        if offload:
+            return await hasher.verify("secret", hashed_password)
+        return verify_password("secret", hashed_password)
+
+    @app.get("/ping")
+    async def ping() -> str:
+        return "pong"
+
+    return app
+
+
+async def hammer(client: AsyncClient, until: float, statuses: dict) -> None:
+    while time.perf_counter() < until:
+        response = await client.post("/login")
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+async def run(offload: bool, logins: int, duration: float, hashed_password: str) -> None:
+    hasher = PasswordHasher(max_workers=4, max_pending=16)
+    app = get_app(hasher, hashed_password, offload)
+    statuses = {}
+    latencies = []
+    async with AsyncClient(app=app, base_url="http://bench") as client:
+        until = time.perf_counter() + duration
+        workers = [asyncio.ensure_future(hammer(client, until, statuses)) for _ in range(logins)]
+        # Probes are due every 5 ms, latency counts from when a probe was due,
+        # so time the event loop was blocked is not hidden
+        due = time.perf_counter()
+        while due < until:
+            due += 0.005
+            await asyncio.sleep(max(due - time.perf_counter(), 0))
+            await client.get("/ping")
+            latencies.append(time.perf_counter() - due)
+            due = max(due, time.perf_counter())
+        await asyncio.gather(*workers)
+    hasher.shutdown()
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1e3
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1e3
+    name = "offloaded" if offload else "inline"
+    print(f"{name:9s} /ping p50 {p50:8.2f} ms  p99 {p99:8.2f} ms  samples {len(latencies):5d}  logins {statuses}")
+
+
+def main(logins: int, duration: float) -> None:
+    hashed_password = get_password_hash("secret")
+    for offload in (False, True):
+        asyncio.run(run(offload, logins, duration, hashed_password))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=8, help="concurrent login loops")
+    parser.add_argument("--duration", type=float, default=5)
+    args = parser.parse_args()
+    main(args.logins, args.duration)
@@ -0,0 +1,101 @@
+"""
+Replay a mix of valid logins, wrong passwords and unknown emails against a
+running service and report latency per kind. With timing equalized logins the
+three distributions overlap, unknown emails must not answer faster.
+
+    python -m scripts.benchmarks.login_load --url http://127.0.0.1:8000/api/v1 \
+        --email user@example.com --password secret --id-token "$ID_TOKEN" \
+        --requests 300 --concurrency 16
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from httpx import AsyncClient
+
+KINDS = ("valid", "wrong password", "unknown email")
+
+
+def credentials(kind: str, email: str, password: str) -> Dict[str, str]:
+    if kind == "valid":
+        return {"username": email, "password": password}
+    if kind == "wrong password":
+        return {"username": email, "password": uuid4().hex}
+    return {"username": f"{uuid4().hex}@example.com", "password": password}
+
+
+async def worker(
+        client: AsyncClient,
+        queue: "asyncio.Queue[str]",
+        email: str,
+        password: str,
+        results: Dict[str, List[float]],
+        statuses: Dict[str, Dict[int, int]],
+) -> None:
+    while True:
+        try:
+            kind = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        start = time.perf_counter()
+        response = await client.post("/auth/get-token/", data=credentials(kind, email, password))
+        results[kind].append(time.perf_counter() - start)
+        statuses[kind][response.status_code] = statuses[kind].get(response.status_code, 0) + 1
+
+
+async def main(
+        url: str,
+        email: str,
+        password: str,
+        id_token: Optional[str],
+        id_token_header: str,
+        requests: int,
+        concurrency: int,
+        invalid_ratio: float,
+) -> None:
+    queue: "asyncio.Queue[str]" = asyncio.Queue()
+    for _ in range(requests):
+        if random.random() >= invalid_ratio:
+            queue.put_nowait("valid")
+        else:
+            queue.put_nowait(random.choice(KINDS[1:]))
+    headers = {id_token_header: f"Bearer {id_token}"} if id_token else {}
+    results: Dict[str, List[float]] = {kind: [] for kind in KINDS}
+    statuses: Dict[str, Dict[int, int]] = {kind: {} for kind in KINDS}
+
+    start = time.perf_counter()
+    async with AsyncClient(base_url=url, headers=headers, timeout=60) as client:
+        await asyncio.gather(*(
+            worker(client, queue, email, password, results, statuses) for _ in range(concurrency)
+        ))
+    elapsed = time.perf_counter() - start
+
+    print(f"{requests} logins in {elapsed:.2f} s, {requests / elapsed:.1f} logins/s")
+    for kind in KINDS:
+        latencies = sorted(results[kind])
+        if not latencies:
+            continue
+        p50 = statistics.median(latencies) * 1e3
+        p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1e3
+        print(f"{kind:15s} n {len(latencies):5d}  p50 {p50:8.1f} ms  p99 {p99:8.1f} ms  status {statuses[kind]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000/api/v1")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--id-token", help="Google ID token selecting the tenant")
+    parser.add_argument("--id-token-header", default="X-IDToken", help="JWT_GIT_HEADER_NAME of the service")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--invalid-ratio", type=float, default=0.5, help="share of invalid logins")
+    args = parser.parse_args()
+    asyncio.run(main(
+        args.url, args.email, args.password, args.id_token, args.id_token_header,
+        args.requests, args.concurrency, args.invalid_ratio,
+    ))
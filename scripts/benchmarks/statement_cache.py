@@ -0,0 +1,69 @@
+"""
+Per call overhead of building and compiling the `CRUDBase.first(params={'id': ...})`
+statement, fresh select on every call (old behaviour) versus the repository statement cache.
+
+    python -m scripts.benchmarks.statement_cache --calls 20000
+"""
+import argparse
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from app.db.models import metadata
+from app.contrib.account.models import User
+from app.contrib.account.repository import CRUDUser
+
+
+def fresh_statement(session: Session, user_id: int) -> None:
+    session.execute(select(User).options().filter().filter_by(id=user_id)).scalars().first()
+
+
+def cached_statement(repo: CRUDUser, session: Session, user_id: int) -> None:
+    stmt, bind_values = repo._statement("first", {"id": user_id})
+    session.execute(stmt, bind_values).scalars().first()
+
+
+def build_only(calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        select(User).options().filter().filter_by(id=i)._generate_cache_key()
+    return (time.perf_counter() - start) / calls
+
+
+def cached_build_only(repo: CRUDUser, calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        repo._statement("first", {"id": i})[0]._generate_cache_key()
+    return (time.perf_counter() - start) / calls
+
+
+def main(calls: int) -> None:
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine, tables=[User.__table__])
+    repo = CRUDUser(User)
+    with Session(engine) as session:
+        session.add(User(email="user@example.com", hashed_password="secret"))
+        session.commit()
+
+        results = {}
+        for name, func in (
+                ("fresh select", lambda i: fresh_statement(session, 1)),
+                ("statement cache", lambda i: cached_statement(repo, session, 1)),
+        ):
+            start = time.perf_counter()
+            for i in range(calls):
+                func(i)
+            results[name] = (time.perf_counter() - start) / calls
+
+    print(f"build + cache key, fresh select:    {build_only(calls) * 1e6:8.2f} us/call")
+    print(f"build + cache key, statement cache: {cached_build_only(repo, calls) * 1e6:8.2f} us/call")
+    for name, elapsed in results.items():
+        print(f"execute on sqlite, {name + ':':17s} {elapsed * 1e6:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.calls)
@@ -0,0 +1,61 @@
+"""
+Requests/sec of the ``get_async_db`` session path, building the tenant engine on every
+request (old behaviour) versus reusing it from ``tenant_registry``.
+
+Start a local MySQL container and point the settings at it::
+
+    docker run --rm -d -p 3306:3306 -e MYSQL_ROOT_PASSWORD=secret -e MYSQL_DATABASE=bench mysql:8
+    DATABASE_HOST=127.0.0.1 DATABASE_PORT=3306 DATABASE_USER=root DATABASE_PASSWORD=secret \
+        python -m scripts.benchmarks.tenant_engines --database bench --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.db.session import get_async_session, tenant_registry
+
+
+async def per_request_engine(database: str) -> None:
+    async_session_local, async_engine = get_async_session(database)
+    try:
+        async with async_session_local() as session:
+            await session.execute(text("SELECT 1"))
+    finally:
+        await async_engine.dispose()
+
+
+async def registry_engine(database: str) -> None:
+    async_session_local, _ = tenant_registry.get(database)
+    async with async_session_local() as session:
+        await session.execute(text("SELECT 1"))
+
+
+async def run(handler, database: str, requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await handler(database)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+async def main(database: str, requests: int, concurrency: int) -> None:
+    before = await run(per_request_engine, database, requests, concurrency)
+    after = await run(registry_engine, database, requests, concurrency)
+    await tenant_registry.dispose()
+    print(f"engine per request: {before:10.1f} req/s")
+    print(f"tenant registry:    {after:10.1f} req/s  (x{after / before:.1f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", default="bench")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.database, args.requests, args.concurrency))
@@ -0,0 +1,66 @@
+"""
+Measure password hashing time on this host and recommend the cost which keeps
+a single hash under the target latency.
+
+    python -m scripts.calibrate_password_hash --target-ms 250
+    python -m scripts.calibrate_password_hash --scheme argon2 --target-ms 250
+"""
+import argparse
+import statistics
+import time
+from typing import Callable, Dict, Optional
+
+from app.utils.security import build_password_context
+
+
+def measure(hash_password: Callable[[str], str], samples: int) -> float:
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hash_password("calibration-password")
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def calibrate(
+        scheme: str,
+        target: float,
+        samples: int,
+        costs: range,
+        memory_cost: Optional[int] = None,
+) -> Dict[int, float]:
+    timings = {}
+    for cost in costs:
+        if scheme == "argon2":
+            context = build_password_context(["argon2"], argon2_time_cost=cost, argon2_memory_cost=memory_cost)
+        else:
+            context = build_password_context(["bcrypt"], bcrypt_rounds=cost)
+        timings[cost] = measure(context.hash, samples)
+        print(f"{scheme} cost {cost:2d}: {timings[cost] * 1e3:9.1f} ms")
+        if timings[cost] > target * 2:
+            # Every following cost is slower still
+            break
+    return timings
+
+
+def main(scheme: str, target_ms: float, samples: int, memory_cost: Optional[int]) -> None:
+    target = target_ms / 1e3
+    costs = range(1, 11) if scheme == "argon2" else range(8, 17)
+    timings = calibrate(scheme, target, samples, costs, memory_cost)
+    fitting = [cost for cost, elapsed in timings.items() if elapsed <= target]
+    if not fitting:
+        print(f"No {scheme} cost hashes within {target_ms:g} ms on this host")
+        return
+    cost = max(fitting)
+    setting = "JWT_PASSWORD_ARGON2_TIME_COST" if scheme == "argon2" else "JWT_PASSWORD_BCRYPT_ROUNDS"
+    print(f"Recommended: {setting}={cost} ({timings[cost] * 1e3:.1f} ms per hash, target {target_ms:g} ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scheme", choices=("bcrypt", "argon2"), default="bcrypt")
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--memory-cost", type=int, default=64 * 1024, help="argon2 memory cost in KiB")
+    args = parser.parse_args()
+    main(args.scheme, args.target_ms, args.samples, args.memory_cost)
@@ -79,3 +79,49 @@ async def test_verify_token_api(async_client: "AsyncClient", simple_user_token_h
     )
 
     assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_verify_tokens_api(async_client: "AsyncClient", simple_user_token_headers):
+    response = await async_client.post(
+        f'{settings.API_V1_STR}/auth/verify-tokens/',
+        json={"tokens": [simple_user_token_headers.get("Authorization"), "invalid"]}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()["data"]
+    assert len(results) == 2
+    assert results[1] == {"message": "Not enough segments", "data": False}
+
+
+@pytest.mark.asyncio
+async def test_get_token_password_hasher_busy_api(monkeypatch) -> None:
+    from httpx import AsyncClient
+
+    from app.contrib.account import repository
+    from app.contrib.account.cache import LoginMissCache
+    from app.db.session import session_tenant, tenant_registry
+    from app.main import app
+    from app.routers import dependency
+    from app.utils.hashing import password_hasher
+
+    async def _test_get_audience() -> str:
+        return "test"
+
+    # The real get_async_db, a known missing email does not touch the database
+    monkeypatch.setattr(app, "dependency_overrides", {dependency.get_audience: _test_get_audience})
+    monkeypatch.setattr(password_hasher, "max_workers", 0)
+    monkeypatch.setattr(password_hasher, "max_pending", 0)
+    login_miss_cache = LoginMissCache(10)
+    monkeypatch.setattr(repository, "login_miss_cache", login_miss_cache)
+    async_session_local, _ = tenant_registry.get("test")
+    async with async_session_local() as session:
+        login_miss_cache.add(session_tenant(session), "busy@example.com")
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            f'{settings.API_V1_STR}/auth/get-token/', data={'username': "busy@example.com", 'password': "secret"},
+        )
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["retry-after"] == "1"
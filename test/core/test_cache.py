@@ -0,0 +1,22 @@
+from app.core.cache import ExpiringLRUCache
+
+
+def test_expiring_lru_cache() -> None:
+    cache = ExpiringLRUCache(2)
+    cache.set("a", 1, expires_at=100)
+    cache.set("b", 2, expires_at=200)
+    assert cache.get("a", now=50) == 1
+    assert cache.get("a", now=100) is None
+    assert len(cache) == 1
+
+    cache.set("c", 3, expires_at=200)
+    cache.get("b", now=50)
+    cache.set("d", 4, expires_at=200)
+    # Least recently used "c" is evicted
+    assert cache.get("c", now=50) is None
+    assert cache.get("b", now=50) == 2
+    assert cache.stats() == {"hits": 3, "misses": 2, "evictions": 1, "size": 2}
+
+    cache.clear()
+    assert len(cache) == 0
+    assert ExpiringLRUCache(0).get("a") is None
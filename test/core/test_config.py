@@ -0,0 +1,12 @@
+import pytest
+from pydantic import ValidationError
+
+from app.conf.config import Settings
+
+
+@pytest.mark.parametrize("interval", [0, -1])
+def test_reap_interval_must_be_positive(interval) -> None:
+    # The reaper would spin on asyncio.sleep(0)
+    with pytest.raises(ValidationError, match="DATABASE_TENANT_REAP_INTERVAL"):
+        Settings(DATABASE_TENANT_REAP_INTERVAL=interval)
+    assert Settings(DATABASE_TENANT_REAP_INTERVAL=1).DATABASE_TENANT_REAP_INTERVAL == 1
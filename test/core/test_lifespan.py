@@ -0,0 +1,28 @@
+import asyncio
+from unittest import mock
+
+from app import main
+from app.contrib.account.repository import rehash_tasks
+from app.utils.jose import codec
+
+
+async def test_lifespan_waits_for_rehash_tasks(monkeypatch) -> None:
+    written = []
+
+    async def update_password_hash() -> None:
+        await asyncio.sleep(0.01)
+        written.append(True)
+
+    async def dispose() -> None:
+        assert written == [True]
+
+    monkeypatch.setattr(codec, "_codec", codec.get_codec())
+    with mock.patch.object(main.tenant_registry, "dispose", side_effect=dispose) as registry_dispose:
+        async with main.lifespan(main.app):
+            task = asyncio.get_running_loop().create_task(update_password_hash())
+            rehash_tasks.add(task)
+            task.add_done_callback(rehash_tasks.discard)
+    registry_dispose.assert_awaited_once()
+    assert not rehash_tasks
+    # Startup installed the app codec
+    assert codec.get_codec().default is not None
@@ -0,0 +1,50 @@
+from app.core.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_render() -> None:
+    histogram = Histogram("db_query_duration_seconds", "Query time", ("tenant", "method"), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "tenant_a", "first")
+    histogram.observe(0.5, "tenant_a", "first")
+    histogram.observe(5, "tenant_a", "first")
+
+    assert list(histogram.collect()) == [
+        '# HELP db_query_duration_seconds Query time',
+        '# TYPE db_query_duration_seconds histogram',
+        'db_query_duration_seconds_bucket{tenant="tenant_a",method="first",le="0.1"} 1',
+        'db_query_duration_seconds_bucket{tenant="tenant_a",method="first",le="1.0"} 2',
+        'db_query_duration_seconds_bucket{tenant="tenant_a",method="first",le="+Inf"} 3',
+        'db_query_duration_seconds_sum{tenant="tenant_a",method="first"} 5.55',
+        'db_query_duration_seconds_count{tenant="tenant_a",method="first"} 3',
+    ]
+
+
+def test_registry_render_collectors() -> None:
+    registry = MetricsRegistry()
+    registry.histogram("latency_seconds", "Latency").observe(0.2)
+
+    @registry.collector
+    def collect():
+        yield 'pool_size{tenant="a\\"b"} 5'
+
+    rendered = registry.render()
+    assert 'latency_seconds_count 1' in rendered
+    assert rendered.endswith('pool_size{tenant="a\\"b"} 5\n')
+
+
+async def test_metrics_endpoint_requires_token(monkeypatch) -> None:
+    from httpx import AsyncClient
+
+    from app.conf.config import settings
+    from app.main import app
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+        assert (await client.get("/metrics")).status_code == 404
+
+        monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+        assert (await client.get("/metrics")).status_code == 401
+        response = await client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+        assert response.status_code == 401
+        response = await client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+        assert response.status_code == 200
+        assert "# TYPE" in response.text
@@ -0,0 +1,262 @@
+import time
+from datetime import datetime
+from unittest import mock
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, Mapped, declarative_base, mapped_column
+
+from app.db.models import metadata
+from app.contrib.account.models import User
+from app.db.repository import (
+    CRUDBaseSync, server_generated_attributes, encode_cursor, inserted_ids, auto_increment_increment
+)
+from app.contrib.account import repository as account_repository
+from app.contrib.account.cache import LoginMissCache, UserIdentityCache
+from app.contrib.account.repository import CRUDUser, CRUDUserSync, convert_users_data_async, invalidate_users
+from app.core.exceptions import PasswordHasherBusy
+from app.db.session import get_async_session, get_sync_session, session_tenant
+from app.utils import security
+from app.utils.hashing import password_hasher
+from app.utils.security import build_password_context
+
+
+def test_statement_cache_reuses_shape() -> None:
+    repo = CRUDUser(User)
+    stmt, bind_values = repo._statement("first", {"id": 1})
+    other_stmt, other_bind_values = repo._statement("first", {"id": 2})
+
+    assert stmt is other_stmt
+    assert bind_values == {"param_id": 1}
+    assert other_bind_values == {"param_id": 2}
+    assert repo._statement("count", {"id": 1})[0] is not stmt
+    assert "IS NULL" in str(repo._statement("first", {"email": None})[0])
+
+
+def test_statement_cache_execute() -> None:
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine, tables=[User.__table__])
+    repo = CRUDUser(User)
+    with Session(engine) as session:
+        session.add_all([
+            User(email="a@example.com", hashed_password="a"),
+            User(email="b@example.com", hashed_password="b"),
+        ])
+        session.commit()
+
+        stmt, bind_values = repo._statement("first", {"email": "b@example.com"})
+        assert session.execute(stmt, bind_values).scalars().first().email == "b@example.com"
+        stmt, bind_values = repo._statement("count", {})
+        assert session.execute(stmt, bind_values).scalar_one() == 2
+        stmt, bind_values = repo._statement("exists", {"email": "c@example.com"})
+        assert session.execute(stmt, bind_values).scalar_one() is False
+
+
+def test_bulk_create_update_delete() -> None:
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine, tables=[User.__table__])
+    repo = CRUDUserSync(User)
+    with Session(engine) as session:
+        ids = repo.bulk_create(
+            session,
+            [{"email": f"user{i}@example.com", "hashed_password": "secret"} for i in range(5)],
+            chunk_size=2,
+            return_ids=True,
+        )
+        assert len(ids) == 5
+        assert repo.count(session) == 5
+
+        updated = repo.bulk_update(
+            session,
+            [{"id": ids[0], "email": "first@example.com"}, {"id": ids[1], "email": "second@example.com"}],
+            chunk_size=1,
+        )
+        assert updated == 2
+        assert repo.first(session, params={"id": ids[1]}).email == "second@example.com"
+
+        assert repo.bulk_delete(session, ids[:3], chunk_size=2) == 3
+        assert repo.count(session) == 2
+
+
+def test_bulk_create_supplied_ids() -> None:
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine, tables=[User.__table__])
+    repo = CRUDUserSync(User)
+    with Session(engine) as session:
+        rows = [{"id": 10 + i * 5, "email": f"user{i}@example.com", "hashed_password": "secret"} for i in range(3)]
+        ids = repo.bulk_create(session, rows, return_ids=True)
+        assert ids == [10, 15, 20]
+
+
+def test_inserted_ids_mysql() -> None:
+    dialect = mock.Mock()
+    dialect.name = "mysql"
+    primary_key = User.__table__.c.id
+    result = mock.Mock(lastrowid=7)
+    rows = [{"email": "a"}, {"email": "b"}, {"email": "c"}]
+
+    assert inserted_ids(result, rows, primary_key, dialect) == [7, 8, 9]
+    assert inserted_ids(result, rows, primary_key, dialect, increment=3) == [7, 10, 13]
+    assert inserted_ids(result, [{"id": 1}, {"id": 4}], primary_key, dialect) == [1, 4]
+    with pytest.raises(ValueError):
+        inserted_ids(result, [{"id": 1}, {"id": None}], primary_key, dialect)
+
+    dialect.name, dialect.insert_returning = "other", False
+    with pytest.raises(ValueError):
+        inserted_ids(result, rows, primary_key, dialect)
+
+
+def test_auto_increment_increment_read_once() -> None:
+    engine = create_engine("sqlite://")
+    session = mock.Mock()
+    session.get_bind.return_value = engine
+    session.execute.return_value.scalar_one.return_value = 2
+
+    assert auto_increment_increment(session) == 2
+    assert auto_increment_increment(session) == 2
+    assert session.execute.call_count == 1
+
+
+def test_create_refresh_follows_session_config() -> None:
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine, tables=[User.__table__])
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    repo = CRUDUserSync(User)
+
+    # Sync sessions expire objects on commit, the created user is reloaded before the session closes
+    session_local, _ = get_sync_session("test")
+    with session_local(bind=engine) as session:
+        user = repo.create(session, {"email": "user@example.com", "hashed_password": "secret"})
+    assert user.id is not None
+    assert user.email == "user@example.com"
+    assert [statement.split()[0] for statement in statements] == ["INSERT", "SELECT"]
+    with session_local(bind=engine) as session:
+        other = CRUDBaseSync(User).create(session, {"email": "base@example.com", "hashed_password": "secret"})
+    assert other.id == user.id + 1
+
+    # Async sessions keep objects loaded, only server generated attributes would be read back
+    statements.clear()
+    async_session_local, _ = get_async_session("test")
+    with Session(engine, expire_on_commit=async_session_local.kw["expire_on_commit"]) as session:
+        user = repo.create(session, {"email": "async@example.com", "hashed_password": "secret"})
+        assert user.id is not None
+        assert [statement.split()[0] for statement in statements] == ["INSERT"]
+
+        repo.update(session, db_obj=user, obj_in={"email": "other@example.com"}, refresh=True)
+        assert [statement.split()[0] for statement in statements] == ["INSERT", "UPDATE", "SELECT"]
+
+
+def test_server_generated_attributes() -> None:
+    class Model(declarative_base()):
+        __tablename__ = "model"
+        id: Mapped[int] = mapped_column(primary_key=True)
+        name: Mapped[str] = mapped_column(sa.String(10))
+        created_at: Mapped[datetime] = mapped_column(server_default=sa.func.now())
+        updated_at: Mapped[datetime] = mapped_column(server_default=sa.func.now(), server_onupdate=sa.func.now())
+
+    assert server_generated_attributes(Model) == ("created_at", "updated_at")
+    assert server_generated_attributes(Model, on_update=True) == ("updated_at",)
+    assert server_generated_attributes(User) == ()
+
+
+@pytest.mark.parametrize("order_by", [None, ["email"], ["-email", "id"], ["email", "-id"]])
+def test_get_all_keyset(order_by) -> None:
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine, tables=[User.__table__])
+    repo = CRUDUserSync(User)
+    with Session(engine) as session:
+        repo.bulk_create(session, [{"email": f"user{i:02}@example.com", "hashed_password": "secret"} for i in range(7)])
+        expected = [user.id for user in repo.get_all(session, order_by=order_by or ["-id"], limit=100)]
+
+        seen, cursor = [], None
+        while True:
+            items, cursor = repo.get_all_keyset(session, cursor=cursor, limit=3, order_by=order_by)
+            seen.extend(user.id for user in items)
+            if cursor is None:
+                break
+        assert seen == expected
+
+        with pytest.raises(ValueError):
+            repo.get_all_keyset(session, cursor=encode_cursor([("id", False)], [1]), order_by=["-email"])
+
+
+def test_user_cache_invalidated_on_write() -> None:
+    engine = create_engine("sqlite:///file:users?mode=memory&uri=true")
+    metadata.create_all(engine, tables=[User.__table__])
+    repo = CRUDUserSync(User)
+    user_cache = UserIdentityCache(10, ttl=60)
+    with Session(engine) as session, mock.patch("app.contrib.account.repository.user_cache", user_cache):
+        tenant = session_tenant(session)
+        user = repo.create(session, {"email": "a@example.com", "password": "secret"})
+        assert user_cache.set_user(tenant, user) == (user.id, "a@example.com")
+        user_cache.set_user("other", user)
+
+        repo.update(session, db_obj=user, obj_in={"email": "b@example.com"})
+        assert user_cache.get_user(tenant, user.id) is None
+        assert user_cache.get_user("other", user.id) is not None
+
+        identity = user_cache.set_user(tenant, user)
+        repo.bulk_delete(session, [identity.id])
+        assert user_cache.get_user(tenant, identity.id) is None
+
+    # Sessions without a known tenant forget the user of every audience
+    user_cache.set(("other", identity.id), identity, expires_at=time.time() + 60)
+    with mock.patch("app.contrib.account.repository.user_cache", user_cache):
+        invalidate_users(Session(), [identity.id])
+    assert len(user_cache) == 0
+
+
+def test_authenticate_upgrades_password_hash(monkeypatch) -> None:
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine, tables=[User.__table__])
+    repo = CRUDUserSync(User)
+    old_hash = build_password_context(["bcrypt"], bcrypt_rounds=4).hash("secret")
+    monkeypatch.setattr(security, "pwd_context", build_password_context(["bcrypt"], bcrypt_rounds=5))
+    with Session(engine) as session:
+        session.add(User(email="a@example.com", hashed_password=old_hash))
+        session.commit()
+
+        assert repo.authenticate(session, "a@example.com", "wrong") is None
+        assert repo.first(session, params={"email": "a@example.com"}).hashed_password == old_hash
+
+        user = repo.authenticate(session, "a@example.com", "secret")
+        assert user.hashed_password.startswith("$2b$05$")
+        assert repo.authenticate(session, "a@example.com", "secret") is not None
+
+
+def test_authenticate_unknown_email(monkeypatch) -> None:
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine, tables=[User.__table__])
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    repo = CRUDUserSync(User)
+    miss_cache = LoginMissCache(10, ttl=30)
+    dummy_verify = mock.Mock(wraps=security.verify_dummy_password)
+    monkeypatch.setattr(security, "pwd_context", build_password_context(["bcrypt"], bcrypt_rounds=4))
+    monkeypatch.setattr(account_repository, "login_miss_cache", miss_cache)
+    monkeypatch.setattr(account_repository, "verify_dummy_password", dummy_verify)
+    with Session(engine) as session:
+        assert repo.authenticate(session, "a@example.com", "secret") is None
+        assert dummy_verify.call_count == 1
+        count = len(statements)
+
+        # Repeated attempts skip the lookup but still spend a verify
+        assert repo.authenticate(session, "A@example.com", "secret") is None
+        assert dummy_verify.call_count == 2
+        assert len(statements) == count
+
+        repo.create(session, {"email": "a@example.com", "password": "secret"})
+        assert repo.authenticate(session, "a@example.com", "secret") is not None
+        assert dummy_verify.call_count == 2
+
+
+async def test_bulk_user_data_hashes_passwords_only(monkeypatch) -> None:
+    monkeypatch.setattr(password_hasher, "max_workers", 0)
+    monkeypatch.setattr(password_hasher, "max_pending", 0)
+
+    # Profile updates do not wait for a slot of the busy hashing pool
+    assert await convert_users_data_async([{"id": 1, "email": "a@example.com"}]) == [{"id": 1, "email": "a@example.com"}]
+    with pytest.raises(PasswordHasherBusy):
+        await convert_users_data_async([{"id": 1}, {"id": 2, "password": "secret"}])
@@ -0,0 +1,209 @@
+import time
+from unittest import mock
+
+import pytest
+from sqlalchemy.exc import DisconnectionError
+
+from app.conf.config import settings
+from app.db.instrumentation import InstrumentedAsyncAdaptedQueuePool, instrumented, repository_method
+from app.db.session import TenantEngineRegistry, get_engine_options, ping_if_idle
+
+
+def test_tenant_registry_reuses_engine() -> None:
+    registry = TenantEngineRegistry()
+    async_session_local, async_engine = registry.get("tenant_a")
+
+    assert registry.get("tenant_a") == (async_session_local, async_engine)
+    assert registry.get("tenant_b")[1] is not async_engine
+    assert async_engine.url.database == "tenant_a"
+    assert len(registry) == 2
+
+
+@pytest.mark.asyncio
+async def test_tenant_registry_dispose() -> None:
+    registry = TenantEngineRegistry()
+    registry.get("tenant_a")
+
+    await registry.dispose()
+
+    assert "tenant_a" not in registry
+    assert len(registry) == 0
+
+
+@pytest.mark.asyncio
+async def test_tenant_registry_lru_eviction() -> None:
+    registry = TenantEngineRegistry(max_engines=2)
+    registry.get("tenant_a")
+    registry.get("tenant_b")
+    registry.get("tenant_a")
+    registry.get("tenant_c")
+
+    assert "tenant_a" in registry
+    assert "tenant_b" not in registry
+    assert registry.stats() == {
+        "tenant_a": {"hits": 1, "misses": 1, "evictions": 0},
+        "tenant_b": {"hits": 0, "misses": 1, "evictions": 1},
+        "tenant_c": {"hits": 0, "misses": 1, "evictions": 0},
+    }
+    await registry.dispose()
+
+
+@pytest.mark.asyncio
+async def test_tenant_registry_reap_idle() -> None:
+    registry = TenantEngineRegistry(idle_timeout=60)
+    registry.get("tenant_a")
+
+    assert await registry.reap_idle() == 0
+    assert await registry.reap_idle(now=time.monotonic() + 60) == 1
+    assert "tenant_a" not in registry
+    assert registry.stats()["tenant_a"]["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_tenant_registry_reap_idle_schema_routing() -> None:
+    registry = TenantEngineRegistry(idle_timeout=60, routing="schema")
+    registry.get("tenant_a")
+    registry.get("tenant_b")
+
+    assert await registry.reap_idle(now=time.monotonic() + 60) == 2
+    assert len(registry) == 0
+    await registry.dispose()
+
+
+@pytest.mark.asyncio
+async def test_tenant_registry_defers_disposing_engines_in_use(mocker) -> None:
+    registry = TenantEngineRegistry(max_engines=1)
+    _, engine_a = registry.get("tenant_a")
+    in_use = {engine_a}
+    mocker.patch.object(TenantEngineRegistry, "_checked_out", side_effect=lambda engine: int(engine in in_use))
+    dispose = mocker.patch.object(type(engine_a), "dispose", mocker.AsyncMock())
+
+    registry.get("tenant_b")
+    assert "tenant_a" not in registry
+    assert await registry.reap_idle() == 0
+    dispose.assert_not_awaited()
+
+    # Every connection of the evicted engine is back
+    in_use.clear()
+    assert await registry.reap_idle() == 0
+    dispose.assert_awaited_once()
+    assert await registry.reap_idle() == 0
+    dispose.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_tenant_registry_schema_routing() -> None:
+    registry = TenantEngineRegistry(max_engines=1, routing="schema")
+    async_session_local, async_engine = registry.get("tenant_a")
+    _, other_engine = registry.get("tenant_b")
+
+    assert async_engine.sync_engine.pool is other_engine.sync_engine.pool
+    assert async_engine.get_execution_options()["schema_translate_map"] == {None: "tenant_a"}
+    async with async_session_local() as session:
+        assert session.bind is async_engine
+    await registry.dispose()
+
+
+@pytest.mark.asyncio
+async def test_tenant_registry_lazy_sync_engine() -> None:
+    registry = TenantEngineRegistry()
+    async_session_local, _ = registry.get("tenant_a")
+
+    assert "sync_session_class" not in async_session_local.kw
+    session_local, engine = registry.get_sync("tenant_a")
+    assert registry.get_sync("tenant_a") == (session_local, engine)
+    assert engine.url.drivername == "mysql+pymysql"
+    await registry.dispose()
+
+
+@pytest.mark.asyncio
+async def test_tenant_registry_sync_engines_bounded(mocker) -> None:
+    registry = TenantEngineRegistry(max_engines=1, idle_timeout=60)
+    _, engine_a = registry.get_sync("tenant_a")
+    dispose = mocker.patch.object(type(engine_a), "dispose")
+
+    _, engine_b = registry.get_sync("tenant_b")
+    dispose.assert_called_once_with()
+    assert registry.get_sync("tenant_a")[1] is not engine_a
+
+    assert await registry.reap_idle() == 0
+    assert await registry.reap_idle(now=time.monotonic() + 60) == 1
+    assert dispose.call_count == 3
+
+    registry.get_sync("tenant_c")
+    await registry.dispose()
+    assert dispose.call_count == 4
+
+
+def test_engine_options_tenant_overrides(mocker) -> None:
+    mocker.patch.object(settings, "DATABASE_POOL_OVERRIDES", {"tenant_a": {"pool_size": 20}})
+
+    assert get_engine_options("tenant_a")["pool_size"] == 20
+    assert get_engine_options("tenant_b")["pool_size"] == settings.DATABASE_POOL_SIZE
+
+
+def test_ping_if_idle() -> None:
+    dialect = mock.Mock()
+    dialect.do_ping.side_effect = [True, Exception("gone away")]
+    checkout = ping_if_idle(30, dialect)
+    connection_record = mock.Mock(info={})
+
+    checkout(None, connection_record, None)
+    connection_record.info["checkin_time"] = time.monotonic()
+    checkout(None, connection_record, None)
+    assert dialect.do_ping.call_count == 0
+
+    connection_record.info["checkin_time"] = time.monotonic() - 60
+    checkout(None, connection_record, None)
+    with pytest.raises(DisconnectionError):
+        checkout(None, connection_record, None)
+    assert dialect.do_ping.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_instrumented_repository_method() -> None:
+    calls = []
+
+    class Repository:
+        @instrumented
+        async def first(self):
+            calls.append(repository_method.get())
+
+    await Repository().first()
+    assert calls == ["first"]
+    assert repository_method.get() == ""
+
+
+@pytest.mark.asyncio
+async def test_tenant_engine_instrumented_pool() -> None:
+    registry = TenantEngineRegistry()
+    _, async_engine = registry.get("tenant_a")
+
+    assert isinstance(async_engine.sync_engine.pool, InstrumentedAsyncAdaptedQueuePool)
+    assert async_engine.sync_engine.pool.tenant == "tenant_a"
+    await registry.dispose()
+    assert async_engine.sync_engine.pool.tenant == "tenant_a"
+
+
+def test_query_timing_survives_failed_queries() -> None:
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import OperationalError
+
+    from app.db import instrumentation
+
+    engine = create_engine("sqlite://")
+    instrumentation.instrument_engine(engine, "tenant_a")
+    with mock.patch.object(instrumentation, "query_duration") as query_duration, engine.connect() as conn:
+        observe = query_duration.observe
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+        assert "query_start" not in conn.info
+        observe.assert_not_called()
+
+        conn.execute(text("SELECT 1"))
+        observe.assert_called_once()
+        elapsed, tenant, method = observe.call_args.args
+        assert 0 <= elapsed < 1
+        assert tenant == ""
+
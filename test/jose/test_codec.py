@@ -0,0 +1,97 @@
+import subprocess
+import sys
+from datetime import datetime
+from uuid import UUID
+
+import pytest
+
+from app.utils.jose import codec, jws, jwt
+from app.utils.jose.exceptions import JWSError, JWTError
+
+
+@pytest.fixture
+def stdlib_codec():
+    previous = codec.get_codec()
+    stdlib_codec = codec.StdlibJSONCodec()
+    codec.set_codec(stdlib_codec)
+    yield stdlib_codec
+    codec.set_codec(previous)
+
+
+def test_default_codec():
+    assert isinstance(codec.get_codec(), codec.OrjsonCodec)
+
+
+def test_app_import_keeps_codec():
+    # The app codec is installed on startup, a fresh interpreter shows what importing does
+    script = "import app.main; from app.utils.jose import codec; print(codec.get_codec().default)"
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "None"
+
+
+@pytest.mark.parametrize("json_codec", [codec.StdlibJSONCodec(), codec.OrjsonCodec()])
+def test_dumps(json_codec):
+    obj = {"b": 1, "a": [1.5, None, True], "c": {"y": "z", "x": 2}}
+    assert json_codec.dumps(obj) == b'{"b":1,"a":[1.5,null,true],"c":{"y":"z","x":2}}'
+    assert json_codec.dumps(obj, sort_keys=True) == b'{"a":[1.5,null,true],"b":1,"c":{"x":2,"y":"z"}}'
+    assert json_codec.loads(json_codec.dumps(obj)) == obj
+    assert json_codec.dumps({
+        "jti": UUID("12345678-1234-5678-1234-567812345678"),
+        "at": datetime(2023, 1, 2, 3, 4, 5),
+    }) == b'{"jti":"12345678-1234-5678-1234-567812345678","at":"2023-01-02T03:04:05"}'
+
+
+def test_tokens_match_stdlib(stdlib_codec):
+    claims = {"a": "b", "jti": UUID("12345678-1234-5678-1234-567812345678")}
+    headers = {"kid": "my-key-id", "another_key": "another_value"}
+    stdlib_token = jwt.encode(dict(claims), "secret", headers=headers)
+    codec.set_codec(codec.OrjsonCodec())
+    assert jwt.encode(dict(claims), "secret", headers=headers) == stdlib_token
+    assert jwt.decode(stdlib_token, "secret")["jti"] == "12345678-1234-5678-1234-567812345678"
+
+
+def test_sign_vector(stdlib_codec):
+    token = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJhIjoiYiJ9.jiMyrsmD8AoHWeQgmxZ5yq8z0lXS67_QGs52AzC8Ru8"
+    assert jws.sign({"a": "b"}, "secret", algorithm="HS256") == token
+    codec.set_codec(codec.OrjsonCodec())
+    assert jws.sign({"a": "b"}, "secret", algorithm="HS256") == token
+
+
+def test_invalid_payload():
+    token = jws.sign(b'{"a": "b"', "secret", algorithm="HS256")
+    with pytest.raises(JWTError, match="Invalid payload string: "):
+        jwt.decode(token, "secret")
+
+
+def test_codec_is_abstract():
+    with pytest.raises(TypeError):
+        codec.JSONCodec()
+
+    class PartialCodec(codec.JSONCodec):
+        def loads(self, data):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialCodec()
+
+
+def test_dumps_falls_back_to_stdlib():
+    json_codec = codec.OrjsonCodec()
+    assert json_codec.dumps({"n": 2 ** 70, "jti": UUID("12345678-1234-5678-1234-567812345678")}) == (
+        b'{"n":1180591620717411303424,"jti":"12345678-1234-5678-1234-567812345678"}'
+    )
+    token = jwt.encode({"n": 2 ** 70}, "secret")
+    assert jwt.decode(token, "secret") == {"n": 2 ** 70}
+
+
+@pytest.mark.parametrize("data", [b'{"n":1180591620717411303424}', '{"n":-9223372036854775809}'])
+def test_loads_big_integers_exactly(data):
+    json_codec = codec.OrjsonCodec()
+    assert json_codec.loads(data) == codec.StdlibJSONCodec().loads(data)
+    assert isinstance(json_codec.loads(data)["n"], int)
+    assert json_codec.loads(b'{"n":9223372036854775807,"f":1.5}') == {"n": 2 ** 63 - 1, "f": 1.5}
+
+
+def test_unserializable_payload():
+    with pytest.raises(JWSError, match="Invalid payload"):
+        jws.sign({"a": object()}, "secret", algorithm="HS256")
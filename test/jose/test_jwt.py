@@ -1,11 +1,12 @@
 import base64
 import json
+from calendar import timegm
 from datetime import datetime, timedelta
 
 import pytest
 
 from app.utils.jose import jws, jwt
-from app.utils.jose.exceptions import JWTError
+from app.utils.jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
 
 
 @pytest.fixture
@@ -522,3 +523,68 @@ class TestJWT:
         new_claims[claim] = value
         token = jwt.encode(new_claims, key)
         jwt.decode(token, key, options=options, audience=str(value))
+
+    def test_decode_loads_token_once(self, claims, key, monkeypatch):
+        token = jwt.encode(claims, key)
+        loads = []
+        load = jws._load
+
+        def counting_load(token):
+            loads.append(token)
+            return load(token)
+
+        monkeypatch.setattr(jws, "_load", counting_load)
+        assert jwt.decode(token, key) == claims
+        assert len(loads) == 1
+
+    def test_decode_parsed_token(self, claims, key):
+        token = jwt.encode(claims, key)
+        assert jwt.decode(jws.load(token), key) == claims
+
+    def test_claim_validator_reused(self, key, monkeypatch):
+        validator = jwt.ClaimValidator({"require_exp": True, "verify_aud": False}, issuer="issuer", leeway=10)
+        assert validator.required == ("exp",)
+        assert validator.options["verify_exp"] is True
+
+        now = timegm(datetime.utcnow().utctimetuple())
+        clock_reads = []
+
+        def counting_now():
+            clock_reads.append(1)
+            return now
+
+        monkeypatch.setattr(jwt, "_now", counting_now)
+        token = jwt.encode({"exp": now - 5, "nbf": now + 5, "iss": "issuer"}, key)
+        assert jwt.decode(token, key, validator=validator)["iss"] == "issuer"
+        assert len(clock_reads) == 1
+
+        with pytest.raises(ExpiredSignatureError):
+            validator.validate({"exp": now - 5}, now=now + 10)
+        with pytest.raises(JWTError, match='missing required key "exp"'):
+            validator.validate({"iss": "issuer"})
+        with pytest.raises(JWTClaimsError, match="Invalid issuer"):
+            jwt.decode(jwt.encode({"exp": now, "iss": "other"}, key), key, validator=validator)
+
+    def test_decode_many(self, key):
+        from concurrent.futures import ThreadPoolExecutor
+
+        now = timegm(datetime.utcnow().utctimetuple())
+        tokens = [
+            jwt.encode({"a": "b", "exp": now + 60}, key),
+            jwt.encode({"a": "b", "exp": now - 60}, key),
+            jwt.encode({"a": "b", "exp": now + 60}, "other"),
+            "not a token",
+        ]
+        expected = []
+        for token in tokens:
+            try:
+                expected.append(jwt.decode(token, key, algorithms=["HS256"]))
+            except JWTError as e:
+                expected.append(str(e))
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for pool in (None, executor):
+                results = jwt.decode_many(tokens, key, algorithms=["HS256"], executor=pool)
+                assert results[0] == expected[0]
+                assert isinstance(results[1], ExpiredSignatureError)
+                assert [str(e) for e in results[1:]] == expected[1:]
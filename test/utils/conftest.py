@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt as google_jwt
+
+from app.utils import security
+from app.utils.security import lazy_jwt_settings
+
+
+def generate_cert():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "stub.googleapis.com")])
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(datetime.utcnow() - timedelta(days=1))
+        .not_valid_after(datetime.utcnow() + timedelta(days=1))
+        .sign(private_key, hashes.SHA256())
+    )
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode("utf-8")
+    return private_pem, cert.public_bytes(serialization.Encoding.PEM).decode("utf-8")
+
+
+class StubCertServer:
+    """
+    Local stand-in of https://www.googleapis.com/oauth2/v1/certs
+    """
+
+    def __init__(self):
+        self.keys = {}
+        self.max_age = 3600
+        self.hits = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits += 1
+                body = json.dumps({kid: cert for kid, (_, cert) in server.keys.items()}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", f"public, max-age={server.max_age}, must-revalidate")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/oauth2/v1/certs"
+
+    def add_key(self, kid: str) -> None:
+        self.keys[kid] = generate_cert()
+
+    def sign(self, kid: str, **claims) -> str:
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com",
+            "aud": "client-id.apps.googleusercontent.com",
+            "sub": "1234567890",
+            "iat": now,
+            "exp": now + 3600,
+        }
+        payload.update(claims)
+        signer = crypt.RSASigner.from_string(self.keys[kid][0], key_id=kid)
+        return google_jwt.encode(signer, payload).decode("utf-8")
+
+
+@pytest.fixture(scope="session")
+def cert_server():
+    server = StubCertServer()
+    server.add_key("key-1")
+    thread = threading.Thread(target=server.httpd.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.httpd.shutdown()
+
+
+@pytest.fixture(scope="module")
+def rsa_key_pair():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode("utf-8")
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode("utf-8")
+    return private_pem, public_pem
+
+
+@pytest.fixture
+def rs256_jwt_keys(monkeypatch, rsa_key_pair):
+    """
+    Signs and verifies tokens with RS256 for the test, the configured keys are restored afterwards
+    """
+    private_pem, public_pem = rsa_key_pair
+    monkeypatch.setattr(lazy_jwt_settings, "JWT_ALGORITHM", "RS256")
+    monkeypatch.setattr(lazy_jwt_settings, "JWT_PRIVATE_KEY", private_pem)
+    monkeypatch.setattr(lazy_jwt_settings, "JWT_PUBLIC_KEY", public_pem)
+    security.reset_jwt_keys()
+    yield
+    monkeypatch.undo()
+    security.reset_jwt_keys()
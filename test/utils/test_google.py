@@ -0,0 +1,144 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from google.auth.exceptions import GoogleAuthError, TransportError
+
+from app.utils import google
+from app.utils.google import GoogleCertCache, VerifiedTokenCache, parse_max_age, verify_google_id_token
+
+
+def test_parse_max_age() -> None:
+    assert parse_max_age("public, max-age=19830, must-revalidate, no-transform") == 19830
+    assert parse_max_age("no-cache") is None
+    assert parse_max_age(None) is None
+
+
+async def test_verify_google_id_token(cert_server) -> None:
+    cert_cache = GoogleCertCache(cert_server.url)
+    hits = cert_server.hits
+
+    for _ in range(3):
+        id_info = await verify_google_id_token(cert_server.sign("key-1"), cert_cache, VerifiedTokenCache(0))
+        assert id_info["aud"] == "client-id.apps.googleusercontent.com"
+    assert cert_server.hits == hits + 1
+
+    with pytest.raises(GoogleAuthError):
+        await verify_google_id_token(
+            cert_server.sign("key-1", iss="https://example.com"), cert_cache, VerifiedTokenCache(0)
+        )
+    with pytest.raises(GoogleAuthError):
+        await verify_google_id_token(
+            cert_server.sign("key-1", exp=int(time.time()) - 3600), cert_cache, VerifiedTokenCache(0)
+        )
+    with pytest.raises(GoogleAuthError, match="too early"):
+        await verify_google_id_token(
+            cert_server.sign("key-1", iat=int(time.time()) + 600), cert_cache, VerifiedTokenCache(0)
+        )
+    with pytest.raises(GoogleAuthError):
+        await verify_google_id_token("invalid", cert_cache, VerifiedTokenCache(0))
+    await cert_cache.aclose()
+
+
+async def test_concurrent_lookups_fetch_once(cert_server) -> None:
+    cert_cache = GoogleCertCache(cert_server.url)
+    hits = cert_server.hits
+    token = cert_server.sign("key-1")
+
+    results = await asyncio.gather(
+        *(verify_google_id_token(token, cert_cache, VerifiedTokenCache(0)) for _ in range(10))
+    )
+    assert all(id_info["sub"] == "1234567890" for id_info in results)
+    assert cert_server.hits == hits + 1
+    await cert_cache.aclose()
+
+
+async def test_cancelled_lookup_does_not_fail_others(cert_server) -> None:
+    release = asyncio.Event()
+    fetches = []
+
+    async def fetch(certs_url):
+        fetches.append(certs_url)
+        await release.wait()
+        return {kid: cert for kid, (_, cert) in cert_server.keys.items()}, None
+
+    cert_cache = GoogleCertCache(cert_server.url, fetch=fetch)
+    first = asyncio.ensure_future(cert_cache.get_keys())
+    second = asyncio.ensure_future(cert_cache.get_keys())
+    await asyncio.sleep(0)
+    # The request which started the fetch goes away
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert "key-1" in await second
+    assert first.cancelled()
+    assert len(fetches) == 1
+    await cert_cache.aclose()
+
+
+@pytest.mark.parametrize("body", ["<html>Service Unavailable</html>", "[]"])
+async def test_malformed_certs_response(body) -> None:
+    cert_cache = GoogleCertCache("https://certs.example.com")
+    cert_cache._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, text=body)))
+    with pytest.raises(TransportError, match="Invalid certificates"):
+        await cert_cache.refresh()
+    await cert_cache.aclose()
+
+
+async def test_unknown_kid_refetches_certs(cert_server) -> None:
+    cert_cache = GoogleCertCache(cert_server.url, min_refetch_interval=0)
+    await verify_google_id_token(cert_server.sign("key-1"), cert_cache, VerifiedTokenCache(0))
+    hits = cert_server.hits
+
+    cert_server.add_key("key-2")
+    await verify_google_id_token(cert_server.sign("key-2"), cert_cache, VerifiedTokenCache(0))
+    assert cert_server.hits == hits + 1
+    await cert_cache.aclose()
+
+
+async def test_certs_refreshed_before_expiry(cert_server) -> None:
+    cert_cache = GoogleCertCache(cert_server.url, refresh_before=cert_server.max_age)
+    await cert_cache.get_keys()
+    hits = cert_server.hits
+
+    # Close to expiry, current keys are served and refreshed in background
+    assert "key-1" in await cert_cache.get_keys()
+    for _ in range(50):
+        if cert_server.hits > hits:
+            break
+        await asyncio.sleep(0.01)
+    assert cert_server.hits == hits + 1
+    await cert_cache.aclose()
+
+
+async def test_verified_token_cache(cert_server, mocker) -> None:
+    cert_cache = GoogleCertCache(cert_server.url)
+    token_cache = VerifiedTokenCache(2)
+    decode = mocker.spy(google, "decode_google_id_token")
+    token = cert_server.sign("key-1", sub="cached")
+
+    for _ in range(3):
+        id_info = await verify_google_id_token(token, cert_cache, token_cache)
+        assert id_info["sub"] == "cached"
+    assert decode.call_count == 1
+    assert token_cache.stats() == {"hits": 2, "misses": 1, "evictions": 0, "size": 1}
+
+    # Failed verifications are not cached
+    with pytest.raises(GoogleAuthError):
+        await verify_google_id_token(cert_server.sign("key-1", iss="https://example.com"), cert_cache, token_cache)
+    assert len(token_cache) == 1
+    await cert_cache.aclose()
+
+
+def test_verified_token_cache_copies_claims() -> None:
+    token_cache = VerifiedTokenCache(2)
+    claims = {"aud": "a"}
+    token_cache.set("token", claims, expires_at=100)
+    claims["aud"] = "b"
+    cached = token_cache.get("token", now=50)
+    assert cached == {"aud": "a"}
+    cached["aud"] = "c"
+    assert token_cache.get("token", now=50) == {"aud": "a"}
+    assert token_cache.get("token", now=100) is None
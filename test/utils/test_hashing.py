@@ -0,0 +1,80 @@
+import asyncio
+import threading
+from unittest import mock
+
+import pytest
+from passlib.hash import argon2
+
+from app.core.exceptions import ImproperlyConfigured, PasswordHasherBusy
+from app.core.handlers import password_hasher_busy_exception
+from app.utils import security
+from app.utils.hashing import PasswordHasher
+from app.utils.security import build_password_context
+
+
+async def test_password_hasher_roundtrip() -> None:
+    hasher = PasswordHasher(max_workers=2, max_pending=2)
+    hashed_password = await hasher.hash("secret")
+    assert await hasher.verify("secret", hashed_password)
+    assert not await hasher.verify("wrong", hashed_password)
+    assert hasher.in_flight == 0
+    hasher.shutdown()
+
+
+async def test_password_hasher_back_pressure() -> None:
+    hasher = PasswordHasher(max_workers=1, max_pending=1)
+    release = threading.Event()
+    running = [asyncio.ensure_future(hasher.run("verify", release.wait)) for _ in range(2)]
+    await asyncio.sleep(0)
+    assert hasher.in_flight == 2
+
+    with pytest.raises(PasswordHasherBusy):
+        await hasher.run("verify", release.wait)
+
+    release.set()
+    assert await asyncio.gather(*running) == [True, True]
+    assert hasher.in_flight == 0
+    hasher.shutdown()
+
+    response = await password_hasher_busy_exception(None, PasswordHasherBusy("busy"))
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_password_context_policy() -> None:
+    old_hash = build_password_context(["bcrypt"], bcrypt_rounds=4).hash("secret")
+    context = build_password_context(["bcrypt"], bcrypt_rounds=5)
+    verified, new_hash = context.verify_and_update("secret", old_hash)
+    assert verified
+    assert new_hash.startswith("$2b$05$")
+    assert context.verify_and_update("secret", new_hash) == (True, None)
+    assert context.verify_and_update("wrong", old_hash) == (False, None)
+
+    if not argon2.has_backend():
+        with pytest.raises(ImproperlyConfigured):
+            build_password_context(["argon2", "bcrypt"])
+
+
+async def test_password_hasher_verify_and_update(monkeypatch) -> None:
+    old_hash = build_password_context(["bcrypt"], bcrypt_rounds=4).hash("secret")
+    monkeypatch.setattr(security, "pwd_context", build_password_context(["bcrypt"], bcrypt_rounds=5))
+    hasher = PasswordHasher(max_workers=1, max_pending=1)
+    verified, new_hash = await hasher.verify_and_update("secret", old_hash)
+    assert verified
+    assert new_hash.startswith("$2b$05$")
+    hasher.shutdown()
+
+
+def test_dummy_hash_built_with_context(monkeypatch) -> None:
+    assert security._dummy_hash.startswith(f"$2b${security.jwt_settings.JWT_PASSWORD_BCRYPT_ROUNDS:02d}$")
+
+    with monkeypatch.context() as m:
+        m.setattr(security.lazy_jwt_settings, "JWT_PASSWORD_BCRYPT_ROUNDS", 4)
+        security.reset_password_context()
+        assert security._dummy_hash.startswith("$2b$04$")
+        hash_ = mock.Mock(wraps=security.pwd_context.hash)
+        m.setattr(security.pwd_context, "hash", hash_)
+        assert security.verify_dummy_password("secret") is False
+        hash_.assert_not_called()
+
+    security.reset_password_context()
@@ -0,0 +1,158 @@
+import time
+from functools import partial
+from uuid import uuid4
+
+import pytest
+from pydantic import ValidationError
+from starlette.requests import Request
+
+from app.conf.config import jwt_settings
+from app.contrib.account.cache import UserIdentity, UserIdentityCache
+from app.contrib.account.schema import TokenPayload
+from app.core.exceptions import HTTPInvalidToken
+from app.routers import dependency
+from app.routers.dependency import get_token_payload
+from app.utils import security
+from app.utils.jose import jwt
+from app.utils.jose.backends.base import Key
+from app.utils.security import (
+    JWTKeys, OAuth2PasswordBearerWithCookie, get_claim_validator, get_jwt_keys, get_request_credentials,
+    jwt_decode, jwt_decode_many, jwt_encode, jwt_payload, lazy_jwt_settings, token_payload_cache,
+)
+
+
+def make_request(headers=None, cookies=None) -> Request:
+    raw_headers = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    if cookies:
+        raw_headers.append((b"cookie", "; ".join(f"{name}={value}" for name, value in cookies.items()).encode()))
+    return Request({"type": "http", "headers": raw_headers})
+
+
+def test_request_credentials_parsed_once() -> None:
+    request = make_request(
+        headers={jwt_settings.JWT_AUTH_HEADER_NAME: "Bearer access", jwt_settings.JWT_GIT_HEADER_NAME: "Basic x"},
+        cookies={jwt_settings.JWT_GIT_COOKIE_NAME: "bearer id-token"},
+    )
+    credentials = get_request_credentials(request)
+    assert credentials.access_token == "access"
+    # Header with another scheme falls back to the cookie
+    assert credentials.id_token == "id-token"
+    assert get_request_credentials(request) is credentials
+    assert request.state.credentials is credentials
+
+
+def test_request_credentials_missing() -> None:
+    credentials = get_request_credentials(make_request(headers={jwt_settings.JWT_AUTH_HEADER_NAME: "Token x"}))
+    assert credentials.access_token is None
+    assert credentials.id_token is None
+
+
+async def test_oauth2_password_bearer_with_cookie() -> None:
+    scheme = OAuth2PasswordBearerWithCookie(tokenUrl="/token/", auto_error=False)
+    request = make_request(cookies={jwt_settings.JWT_AUTH_COOKIE_NAME: "Bearer from-cookie"})
+    assert await scheme(request) == "from-cookie"
+    assert await scheme(make_request()) is None
+
+
+async def test_token_payload_cache(monkeypatch) -> None:
+    monkeypatch.setattr(lazy_jwt_settings, "JWT_DECODE_HANDLER", partial(jwt_decode, audience="client"))
+    token = lazy_jwt_settings.JWT_ENCODE_HANDLER(
+        lazy_jwt_settings.JWT_PAYLOAD_HANDLER({"user_id": 1, "aud": "client", "jti": str(uuid4())})
+    )
+    token_payload_cache.clear()
+    hits = token_payload_cache.hits
+
+    payload = await get_token_payload(token)
+    assert await get_token_payload(token) is payload
+    assert token_payload_cache.hits == hits + 1
+    # A request cannot change the payload served to the next ones
+    with pytest.raises(ValidationError):
+        payload.user_id = 2
+
+    # Rotated keys must not serve tokens verified with the previous ones
+    lazy_jwt_settings.reload()
+    assert len(token_payload_cache) == 0
+
+    with pytest.raises(HTTPInvalidToken):
+        await get_token_payload(token[:-2])
+    assert len(token_payload_cache) == 0
+
+
+async def test_current_user_served_from_cache(monkeypatch) -> None:
+    user_cache = UserIdentityCache(10, ttl=60)
+    monkeypatch.setattr(dependency, "user_cache", user_cache)
+    payload = TokenPayload(user_id=1, exp=int(time.time()) + 60, aud="client")
+    user_cache.set(("tenant", 1), UserIdentity(1, "a@example.com"), time.time() + 60)
+
+    # No database session needed while the user is cached
+    user = await dependency.get_current_user(payload, "tenant", None)
+    assert user == UserIdentity(1, "a@example.com")
+    assert user.email == "a@example.com"
+
+
+def test_jwt_keys_built_once(monkeypatch, rs256_jwt_keys) -> None:
+    keys = get_jwt_keys()
+    assert isinstance(keys.signing_key, Key)
+    assert isinstance(keys.verifying_key, Key)
+    token = jwt_encode(jwt_payload({"user_id": 1, "aud": "client", "jti": str(uuid4())}))
+    assert jwt.get_unverified_header(token)["alg"] == "RS256"
+    assert jwt_decode(token, audience="client")["user_id"] == 1
+    assert get_jwt_keys() is keys
+
+    monkeypatch.undo()
+    security.reset_jwt_keys()
+    assert get_jwt_keys().algorithm == jwt_settings.JWT_ALGORITHM
+
+
+def test_claim_validator_built_once(monkeypatch) -> None:
+    validator = get_claim_validator("backend", "client")
+    assert get_claim_validator("backend", "client") is validator
+    assert get_claim_validator("backend", None) is not validator
+    assert validator.required == ("exp", "jti")
+
+    token = jwt_encode(jwt_payload({"user_id": 1, "aud": "client", "jti": str(uuid4())}))
+    assert jwt_decode(token, audience="client")["user_id"] == 1
+
+    with monkeypatch.context() as m:
+        m.setattr(lazy_jwt_settings, "JWT_LEEWAY", 30)
+        security.reset_claim_validators()
+        assert get_claim_validator("backend", "client").leeway == 30
+
+    security.reset_claim_validators()
+    assert get_claim_validator("backend", "client").leeway == jwt_settings.JWT_LEEWAY
+
+
+def test_jwt_decode_many(rs256_jwt_keys) -> None:
+    tokens = [
+        jwt_encode(jwt_payload({"user_id": user_id, "aud": "client", "jti": str(uuid4())}))
+        for user_id in range(4)
+    ]
+    tokens.append(tokens[0][:-4])
+    results = jwt_decode_many(tokens, audience="client")
+    assert security.get_jwt_executor() is not None
+    assert [result["user_id"] for result in results[:4]] == [0, 1, 2, 3]
+    assert str(results[4]) == "Signature verification failed."
+    assert str(jwt_decode_many(tokens[:1])[0]) == "Invalid audience"
+
+    security.shutdown_jwt_executor()
+
+
+def test_jwt_encode_claim_types(monkeypatch) -> None:
+    from decimal import Decimal
+
+    from app.utils.jose import codec
+
+    monkeypatch.setattr(codec, "_codec", codec.get_codec())
+    security.install_jwt_codec()
+    claims = {"user_id": 1, "aud": "client", "jti": uuid4(), "balance": Decimal("1.5"), "n": 2 ** 70}
+    token = jwt_encode(jwt_payload(claims))
+    payload = jwt_decode(token, audience="client")
+    assert payload["jti"] == str(claims["jti"])
+    assert payload["balance"] == 1.5
+    assert payload["n"] == 2 ** 70
+
+
+def test_jwt_keys_keep_unusable_key_material() -> None:
+    keys = JWTKeys("RS256", secret_key="not a pem key")
+    assert keys.signing_key == "not a pem key"
+    assert JWTKeys("HS256").verifying_key is None